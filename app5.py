@@ -1,5 +1,7 @@
+import functools
+import uuid
+
 import streamlit as st
-import gspread
 import pandas as pd
 from datetime import datetime
 
@@ -26,88 +28,35 @@ st.markdown(
 
 
 #----------------------------------------------------------------------------------------------------------
-# --- Authenticate using Service Account JSON ------------------------------------------------------------
+# --- Authentication, sheet mapping and loading live in csm_data.py ----------------------------------------
 #----------------------------------------------------------------------------------------------------------
 
+# csm_data is imported once per server process, so the shared Sheets client and the loaded sheets are
+# reused across reruns and sessions instead of being fetched again on every click.
+from csm_data import (
+    sheet_mapping, load_sheets, sheet_cache, LazySheets,
+    login_types, login_sheet, normalize_logic_id, get_users_by_type, user_selection, get_sheet_summary,
+    editable_columns, display_columns, prepare_save, save_queue, highlight_frame,
+    page_size_options, DEFAULT_PAGE_SIZE, get_row_key_column, get_row_ids, apply_edits, collect_edits, settle_save,
+    PREWARM, prewarmer, perf, is_admin, session_memory, SESSION_MEMORY_BUDGET,
+    narrow_selection, export_formats, export_jobs,
+)
 
+# Time every stage of this rerun; the run is logged at the end of the script (see PerfRecorder in csm_data)
+perf_session = st.session_state.setdefault("perf_session", uuid.uuid4().hex[:12])
+perf.begin(perf_session)
 
+# Keep every sheet loaded and indexed ahead of users (one background thread per server process)
+if PREWARM:
+    prewarmer.start()
 
-gc = gspread.service_account(filename=r"G:\My Drive\Colab Notebooks\voltaic-mantra-402407-7dfb4640ec7b.json")
-spreadsheet = gc.open_by_key("13lD9l0vvEspPtgb-efKch6m5Cjap-5OtyR48XsqZDTs")
-
-
-
-# --- Sheet Mapping ---
-sheet_mapping = {
-    "Open - Complaint - SR": "Complaint-Final",
-    "Open Sites": "Open-Sites-Final",
-    "Stock Liquidation Project": "Project Stock at Site-Final",
-    "Drawing Hold Status": "WCS-Final",
-    "FG Status": "FG-Final",
-    "Reorder": "Reorder",
-    "Appreciation": "Testimonial"
-}
-
-# Columns to select for Testimonial sheet only
-testimonial_columns = [
-    'CSM Names', 'Date', 'Month', 'Id', 'RE Name', 'Zone', 'Customer Name',
-    'City', 'Segment', 'Product', 'MSC ID', 'Testimonial Type'
-]
-
-
-
-# -----------------------------------------------------------------------------------------------------------------
-# 2️⃣ Load Data from Google Sheets
-# -----------------------------------------------------------------------------------------------------------------
-
-def load_data(sheet_name):
-    """Loads only non-empty rows and columns from Google Sheets, with special handling for 'Testimonial'."""
-    try:
-        sheet = spreadsheet.worksheet(sheet_name)
-        data = sheet.get_all_values()
-
-        if not data:
-            return pd.DataFrame()
-
-        df = pd.DataFrame(data)
-
-        # Remove completely empty rows
-        df = df.loc[~df.apply(lambda row: all(cell == "" for cell in row), axis=1)].reset_index(drop=True)
-
-        if df.empty:
-            return df
-
-        # Set the first row as header
-        df.columns = df.iloc[0].str.strip()
-        df = df.drop(0).reset_index(drop=True)
-
-        # Remove completely empty columns
-        df = df.dropna(axis=1, how="all")
-
-        # If this is the 'Testimonial' sheet, filter specific columns
-        if sheet_name == "Appreciation":
-            df = df[[col for col in testimonial_columns if col in df.columns]]
-
-        # Add optional columns if missing
-        for col in ["Clearance Date", "Remarks", "Support Required"]:
-            if col not in df.columns:
-                df[col] = ""
-
-        return df
-
-    except Exception as e:
-        st.markdown(f"<p style='font-size:8px; color: red;'>⚠️ Unable to load sheet: {sheet_name}. ({e})</p>", 
-                    unsafe_allow_html=True)
-        return pd.DataFrame()
 
-# Load all sheets into df_mapping (only where data is present)
-df_mapping = {
-    key: df for key, sheet in sheet_mapping.items() if not (df := load_data(sheet)).empty
-}
+# Sheets are loaded lazily: a tab's worksheet is only fetched when the tab (or a summary count) needs it
+df_mapping = LazySheets(sheet_mapping)
 
-# Load Users sheet separately if it has data
-df_users = load_data("Users")
-df_users = df_users if not df_users.empty else None
+# The login page only needs the sheet holding Logic IDs and the Users sheet: one batched request
+with perf.stage("load:login"):
+    load_sheets([sheet_mapping[login_sheet], "Users"])
 
 
 
@@ -123,19 +72,7 @@ if "authenticated" not in st.session_state:
 
 
 # --- Extract Login Data (Based on Selected Type) ---
-def get_users_by_type(user_type):
-    """Fetch users dynamically based on selected login type."""
-    users = set()
-    
-    if "Drawing Hold Status" in df_mapping:
-        wcs_df = df_mapping["Drawing Hold Status"]
-        if not wcs_df.empty:
-            for _, row in wcs_df.iterrows():
-                logic_id = row.get(user_type, "").strip()
-                if logic_id:
-                    users.add(logic_id)  # Store Logic ID for all user types
-
-    return users    
+# get_users_by_type (csm_data) looks Logic IDs up in the login index built from the sheets loaded above
 
 
 
@@ -184,13 +121,14 @@ if not st.session_state["authenticated"]:
     with col2:  # 50% width in the center
         st.markdown('<div class="title-box">🔑 Login to CSM Dashboard</div>', unsafe_allow_html=True)
 
-        user_type = st.selectbox("Select your login type", ["CSM Updated", "Nation", "All India"])
+        user_type = st.selectbox("Select your login type", login_types)
         
-        users = get_users_by_type(user_type)
+        with perf.stage("login_index"):
+            users = get_users_by_type(user_type)
         if not users:
             st.warning("⚠ No users found for the selected type.")
 
-        logic_id = st.text_input("👤 Enter your Logic ID").strip().lower()  # Normalize case
+        logic_id = normalize_logic_id(st.text_input("👤 Enter your Logic ID"))  # Normalize case
 
         if st.button("Login"):
             if logic_id == "":
@@ -279,51 +217,18 @@ for i, tab_name in enumerate(tab_names):
 # 5️⃣ Display Data in Table Format (with Sorting & Highlighting)
 # -------------------------------------------------------------------------------------------
 
-selected_tab = st.session_state["selected_tab"]
-df_selected = df_mapping[selected_tab]
-
-if df_selected.empty:
-    st.warning(f"⚠️ No data found for {selected_tab}.")
-    st.stop()
-
-# Dynamically select the correct column based on the login type
-user_type_column = st.session_state["user_type"]  # "CSM Updated", "Nation", or "All India"
-logic_id = st.session_state["logic_id"]
-
-# Ensure the column exists in the DataFrame
-if user_type_column not in df_selected.columns:
-    st.warning(f"⚠️ Column '{user_type_column}' not found in data for {selected_tab}.")
-    st.stop()
-
-# Filter Data based on selected column (CSM Updated / Nation / All India)
-filtered_df = df_selected[df_selected[user_type_column] == logic_id]
-
-# st.subheader(f"📝 Update Records for {selected_tab} ({user_type_column})")
-
-if filtered_df.empty:
-    st.warning("⚠️ No records assigned to you.")
-    st.stop()
-
-
 #st.dataframe(filtered_df)
 
 st.markdown("---")  # Separator below
 
 
 # --- Sorting Logic ---
-
-# Mapping for sorting columns
-sorting_column = {
-    "Open - Complaint - SR": "Ticket Ageing",
-    "Open Sites": "Aging",
-    "Stock Liquidation Project": "Aging",
-    "Drawing Hold Status": "Hold Age",
-    "FG Status": "Aging"
-}
+# Sorting columns and highlight thresholds per tab: sorting_column / ageing_thresholds in csm_data
 
 
 selected_tab = st.session_state["selected_tab"]
-df_selected = df_mapping[selected_tab]
+with perf.stage(f"load:{selected_tab}"):
+    df_selected = df_mapping[selected_tab]
 
 if df_selected.empty:
     st.warning(f"⚠️ No data found for {selected_tab}.")
@@ -341,34 +246,35 @@ if user_type_column not in df_selected.columns:
 #-------------------------------------------------------------------------------------
 # --- Place Refresh Button Next to Subheader ---
 #------------------------------------------------------------------------------------
-# Filter Data based on selected column
-filtered_df = df_selected[df_selected[user_type_column] == logic_id]
-col1, col2 = st.columns([20, 1])  # Adjust ratio to align properly
+# Filter Data based on selected column (CSM Updated / Nation / All India) via the per-user row index, sorted by
+# the tab's ageing column (high to low). Only the row positions are kept for this session; rows are taken
+# from the shared frame page by page. The sort is also timed on its own ("sort", within "filter"), on the
+# reruns that rebuild the selection.
+with perf.stage("filter"):
+    selected_rows = user_selection(perf_session, selected_tab, df_selected, user_type_column, logic_id)
+col1, col2, col3 = st.columns([19, 1, 1])  # Adjust ratio to align properly
 
 with col1:
     st.markdown(f"<h5>📝 Update Records for {selected_tab} ({user_type_column})</h5>", 
                 unsafe_allow_html=True)  # h5 makes text smaller
 
 with col2:
-    if st.button("🔄", help="Refresh Data", key="refresh_button"):
-        df_mapping = {key: load_data(sheet) for key, sheet in sheet_mapping.items()}
-        st.session_state["last_refresh"] = pd.Timestamp.now()
+    if st.button("🔄", help=f"Refresh {selected_tab}", key="refresh_button"):
+        sheet_cache.invalidate(sheet_mapping[selected_tab])  # only this tab is reloaded on the rerun
         st.rerun()  # Refresh the page
 
+with col3:
+    if st.button("🔁", help="Refresh all tabs", key="refresh_all_button"):
+        sheet_cache.invalidate()  # every sheet is reloaded when next needed
+        st.rerun()
+
 
 
 
-if filtered_df.empty:
+if len(selected_rows) == 0:
     st.warning("⚠️ No records assigned to you.")
     st.stop()
 
-# --- Apply Sorting ---
-sort_col = sorting_column.get(selected_tab)
-
-if sort_col and sort_col in filtered_df.columns:
-    filtered_df[sort_col] = pd.to_numeric(filtered_df[sort_col], errors="coerce")
-    filtered_df = filtered_df.sort_values(by=sort_col, ascending=False)
-
 
 
 
@@ -380,67 +286,57 @@ if sort_col and sort_col in filtered_df.columns:
 
 st.sidebar.header("Filters")
 
+# Options come from the precomputed Nation → Zone → CSM tree of the user's rows in this tab
+with perf.stage("summary"):
+    tab_summary = get_sheet_summary(selected_tab, df_selected, user_type_column)
+
 # --- Nation Dropdown ---
-selected_nation = st.sidebar.selectbox("Select Nation", ["All"] + sorted(filtered_df["Nation"].dropna().unique()))
+selected_nation = st.sidebar.selectbox("Select Nation", ["All"] + tab_summary.nations(logic_id))
 
 # --- Filter Zones Based on Selected Nation ---
-if selected_nation == "All":
-    available_zones = sorted(filtered_df["Zone"].dropna().unique())
-else:
-    available_zones = sorted(filtered_df[filtered_df["Nation"] == selected_nation]["Zone"].dropna().unique())
+available_zones = tab_summary.zones(logic_id, selected_nation)
 
 # --- Zone Dropdown (Filtered Based on Nation) ---
 selected_zone = st.sidebar.selectbox("Select Zone", ["All"] + available_zones)
 
 # --- Filter CSMs Based on Selected Zone ---
-if selected_zone == "All":
-    available_csms = sorted(filtered_df["CSM Updated"].dropna().unique())
-else:
-    available_csms = sorted(filtered_df[filtered_df["Zone"] == selected_zone]["CSM Updated"].dropna().unique())
+available_csms = tab_summary.csms(logic_id, selected_zone)
 
 # --- CSM Dropdown (Filtered Based on Zone) ---
 selected_csm = st.sidebar.selectbox("Select CSM Updated", ["All"] + available_csms)
 
-# --- Apply Selection Without Filtering ---
-filtered_df_temp = filtered_df.copy()
-
-# --- Highlight Rows Instead of Filtering ---
-def highlight_ageing(row):
-    if selected_tab == "Open - Complaint - SR":
-        if row["Ticket Ageing"] < 20:
-            return ["background-color: lightgreen"] * len(row)
-        elif row["Ticket Ageing"] >= 20:
-            return ["background-color: lightcoral"] * len(row)
-    elif selected_tab == "Open Sites":
-        if row["Aging"] < 25:
-            return ["background-color: lightgreen"] * len(row)
-        elif row["Aging"] >= 25:
-            return ["background-color: lightcoral"] * len(row)
-    elif selected_tab == "Stock Liquidation Project":
-        if row["Aging"] < 25:
-            return ["background-color: lightgreen"] * len(row)
-        elif row["Aging"] >= 25:
-            return ["background-color: lightcoral"] * len(row)
-    return [""] * len(row)
-
-#st.dataframe(filtered_df_temp.style.apply(highlight_ageing, axis=1))
+# --- Apply Selection Without Filtering (the choices narrow the export below, not the table) ---
+filter_choices = {"Nation": selected_nation, "Zone": selected_zone, "CSM Updated": selected_csm}
 
 #-----------------------------------------------------------------
 # --- Sidebar: Summary Counts ---
 #-----------------------------------------------------------------
 st.sidebar.subheader("📊 Summary Counts")
 
-# Select CSM
-selected_csm = st.sidebar.selectbox("Select CSM", filtered_df["CSM Updated"].unique())
+# Select CSM ("All" rolls up everything a Nation / All India login covers)
+csm_options = tab_summary.csms(logic_id)
+if user_type_column != "CSM Updated":
+    csm_options = ["All"] + csm_options
+selected_csm = st.sidebar.selectbox("Select CSM", csm_options)
 
 # Define sheet names
 sheets_to_count = ["Open - Complaint - SR", "Open Sites", "Stock Liquidation Project", "Drawing Hold Status", "FG Status", "Reorder",'Appreciation']
 
-# Count rows for each sheet **only for the selected CSM**
-summary_counts = {
-    sheet: len(df_mapping[sheet][df_mapping[sheet]["CSM Updated"] == selected_csm]) if sheet in df_mapping else 0
-    for sheet in sheets_to_count
-}
+# Count rows for each sheet **only for the selected CSM** (sheets not loaded yet come in one batch),
+# read from each sheet's precomputed summary instead of scanning it
+with perf.stage("load:counts"):
+    df_mapping.prefetch(sheets_to_count)
+with perf.stage("summary"):
+    if selected_csm == "All":
+        summary_counts = {
+            sheet: get_sheet_summary(sheet, df_mapping[sheet], user_type_column).count(logic_id) if sheet in df_mapping else 0
+            for sheet in sheets_to_count
+        }
+    else:
+        summary_counts = {
+            sheet: get_sheet_summary(sheet, df_mapping[sheet], "CSM Updated").count(selected_csm) if sheet in df_mapping else 0
+            for sheet in sheets_to_count
+        }
 
 # Custom CSS to reduce font size
 st.sidebar.markdown(
@@ -455,53 +351,80 @@ st.sidebar.markdown(
     unsafe_allow_html=True,
 )
 
-# Display counts in smaller font
+# Display counts in smaller font, with the time each sheet's data was loaded
 for sheet, count in summary_counts.items():
-    st.sidebar.markdown(f'<p class="small-text">{sheet}: <b>{count}</b></p>', unsafe_allow_html=True)
-
-# Display last refresh time in smaller font
-if "last_refresh" in st.session_state:
+    loaded_at = sheet_cache.loaded_at(sheet_mapping[sheet])
+    offline = " 📦" if sheet_cache.source(sheet_mapping[sheet]) == "snapshot" else ""  # served from local snapshot
+    loaded_text = f' <span style="color:#666;">({loaded_at:%H:%M}{offline})</span>' if loaded_at else ""
+    st.sidebar.markdown(f'<p class="small-text">{sheet}: <b>{count}</b>{loaded_text}</p>', unsafe_allow_html=True)
+
+# Display last refresh time of the selected tab in smaller font
+last_refresh = sheet_cache.loaded_at(sheet_mapping[selected_tab])
+if last_refresh:
     st.sidebar.markdown(
-        f'<p class="small-text">Last Refreshed: {st.session_state["last_refresh"].strftime("%Y-%m-%d %H:%M:%S")}</p>',
+        f'<p class="small-text">Last Refreshed ({selected_tab}): {last_refresh.strftime("%Y-%m-%d %H:%M:%S")}</p>',
         unsafe_allow_html=True,
     )
 
 
 
 
-#---------------------------------------------------------------------------
-# --- Apply Header Styling ---
-#---------------------------------------------------------------------------
-
-def color_headers(s):
-    return ['background-color: lightblue; color: black; font-weight: bold' for _ in s]
-
-styled_df = filtered_df_temp.style.set_table_styles(
-    [{'selector': 'thead th',
-      'props': [('background-color', 'darkblue'), 
-                ('color', 'white'), 
-                ('font-weight', 'bold'),
-                ('text-align', 'center')]}]
-).apply(color_headers, axis=0)
-
-# --- Display Final Filtered Data ---
-#st.dataframe(styled_df)
-
-
-
 #-----------------------------------------------------------------------------
 # --- Editable Columns ---
 #-----------------------------------------------------------------------------
 
-# Define editable columns
-editable_columns = ["Clearance Date", "Remarks", "Support Required"]
-filtered_df["Clearance Date"] = pd.to_datetime(filtered_df["Clearance Date"], errors="coerce").dt.date
-
-df_display = filtered_df.copy()
-
-df_display["Clearance Date"] = pd.to_datetime(df_display["Clearance Date"], errors="coerce").dt.date
-df_display = filtered_df.iloc[:,3:]
-
+# Editable columns are defined in csm_data (editable_columns)
+
+# --- Paging: sort/filter happen above on the full selection; only the visible page is styled and sent ---
+total_rows = len(selected_rows)
+page_col, size_col, number_col = st.columns([6, 2, 2])
+
+with size_col:
+    page_size = st.selectbox("Rows per page", page_size_options,
+                             index=page_size_options.index(DEFAULT_PAGE_SIZE), key="page_size")
+
+page_count = 1 if page_size == "All" else max(1, -(-total_rows // page_size))
+page_key = f"page_{selected_tab}"
+if st.session_state.get(page_key, 1) > page_count:
+    st.session_state[page_key] = page_count  # the selection shrank since this page was chosen
+
+with number_col:
+    page_number = st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, step=1, key=page_key)
+
+page_start = 0 if page_size == "All" else (page_number - 1) * page_size
+page_end = total_rows if page_size == "All" else min(page_start + page_size, total_rows)
+with page_col:
+    st.caption(f"Showing rows {page_start + 1}–{page_end} of {total_rows}")
+
+page_rows = selected_rows[page_start:page_end]
+
+# "Clearance Date" is parsed at load time; the editor's DateColumn wants plain dates
+shown_columns = display_columns(selected_tab, df_selected)
+df_display = df_selected[shown_columns].take(page_rows)  # one page, not the whole selection
+df_display["Clearance Date"] = df_display["Clearance Date"].dt.date
+
+# Edits made on any page live in session state, keyed by row id (see row_ids in csm_data), and are
+# re-applied whenever their page is shown again. The editor is keyed by tab and page, so Streamlit keeps
+# its own edits while the page stays on screen even though the stored edits change the data it is given.
+key_column = get_row_key_column(selected_tab, df_selected)
+all_edits = st.session_state.setdefault("edits", {})
+all_saved = st.session_state.setdefault("saved", {})
+saves_in_flight = st.session_state.setdefault("saves_in_flight", [])
+
+# Once a queued save has gone through, its cells stop counting as edits and become this session's
+# baseline (the rows as loaded plus what this session saved), so later saves do not write them again
+for save in list(saves_in_flight):
+    save_status = save_queue.status(save["ticket"])
+    if save_status is None or save_status["state"] in ("saved", "failed"):
+        saves_in_flight.remove(save)
+    if save_status and save_status["state"] == "saved":
+        settle_save(all_edits.setdefault(save["tab"], {}), all_saved.setdefault(save["tab"], {}), save["edits"])
+
+tab_edits = all_edits.setdefault(selected_tab, {})
+tab_saved = all_saved.setdefault(selected_tab, {})
+sheet_ids = get_row_ids(selected_tab, df_selected, key_column)
+page_ids = sheet_ids.iloc[page_rows]
+df_display = apply_edits(df_display, tab_saved, page_ids)
 
 # Streamlit UI
 # st.title("Ticket Management System")
@@ -509,83 +432,138 @@ df_display = filtered_df.iloc[:,3:]
 # Dropdown for selecting tabs
 # selected_tab = st.selectbox("Select a tab", ["Open - Complaint - SR", "Open Sites", "Stock Liquidation Project"])
 
-def highlight_rows(row):
-    highlight_color = ""
-    if selected_tab == "Open - Complaint - SR":
-        if row["Ticket Ageing"] < 20:
-            highlight_color = "background-color: lightgreen"
-        elif row["Ticket Ageing"] >= 20:
-            highlight_color = "background-color: lightcoral"
-    elif selected_tab == "Open Sites":
-        if row["Aging"] < 25:
-            highlight_color = "background-color: lightgreen"
-        elif row["Aging"] >= 25:
-            highlight_color = "background-color: lightcoral"
-    elif selected_tab == "Stock Liquidation Project":
-        if row["Aging"] < 25:
-            highlight_color = "background-color: lightgreen"
-        elif row["Aging"] >= 25:
-            highlight_color = "background-color: lightcoral"
-    
-    return [highlight_color if col not in editable_columns else "" for col in row.index]
-
-# Apply color formatting
-df_display = df_display.style.apply(highlight_rows, axis=1)
-
-# Editable DataFrame
-edited_df = st.data_editor(
-    df_display,
-    column_config={
-        "Clearance Date": st.column_config.DateColumn(
-            "Clearance Date",
-            min_value=datetime.today().date()
-        ),
-        "Remarks": st.column_config.TextColumn("Remarks"),
-        "Support Required": st.column_config.TextColumn("Support Required"),
-    },
-    disabled=[col for col in filtered_df.columns if col not in editable_columns],
-    hide_index=True,
-)
+# Apply color formatting (whole-column masks, see highlight_frame in csm_data)
+with perf.stage("style"):
+    shown_page = apply_edits(df_display, tab_edits, page_ids)
+    styled_page = shown_page.style.apply(highlight_frame, axis=None, tab=selected_tab)
+
+# Editable DataFrame (the Styler is evaluated here, while the page is serialized)
+with perf.stage("render"):
+    edited_page = st.data_editor(
+        styled_page,
+        column_config={
+            "Clearance Date": st.column_config.DateColumn(
+                "Clearance Date",
+                min_value=datetime.today().date()
+            ),
+            "Remarks": st.column_config.TextColumn("Remarks"),
+            "Support Required": st.column_config.TextColumn("Support Required"),
+        },
+        disabled=[col for col in shown_columns if col not in editable_columns],
+        hide_index=True,
+        key=f"editor_{selected_tab}_{page_start}_{page_end}",
+    )
+collect_edits(df_display, edited_page, page_ids, tab_edits, shown=shown_page)
+
+edits_caption = st.empty()  # filled in below the save button, which may queue these edits
 
 
 # ---------------------------------------------------------------------------------------------
 # 6️⃣ Save Updated Data
 # ---------------------------------------------------------------------------------------------
-def save_to_google_sheet(df, selected_tab):
+# --- Save Button ---
+# Saves go to a background queue; only the cells changed since load are written, matched by row key
+if st.button("💾 Save Data"):
     try:
-        # Convert all datetime columns to string format to avoid serialization errors
-        df = df.astype(str)
-
-        # Define explicit mapping of tabs to their corresponding "Clear" sheets
-        clear_sheet_mapping = {
-            "Complaint File": "Complaint Clear",
-            "Open Sites Final": "Open SitesClear",
-            "Project Stock at Site-Final": "Project Stock at Site-Clear",
-            "WCS-Final": "WCS Clear",
-            "FG-Final":"FG Clear",
-            "Reorder":"Reorder Clear"
-
-        }
-
-        # Get the correct "Clear" sheet name based on the selected tab
-        clear_sheet_name = clear_sheet_mapping.get(selected_tab, f"{selected_tab} Clear")  # Default fallback
-
-        # Access or Create the Target Sheet
-        try:
-            sheet = spreadsheet.worksheet(clear_sheet_name)
-        except gspread.exceptions.WorksheetNotFound:
-            sheet = spreadsheet.add_worksheet(title=clear_sheet_name, rows=str(df.shape[0]), cols=str(df.shape[1]))
-
-        # Update Google Sheet with cleaned data
-        sheet.update([df.columns.values.tolist()] + df.values.tolist())
-
-        st.success(f"✅ Data successfully saved to '{clear_sheet_name}' sheet.")
+        with perf.stage("save"):
+            # Rows edited on every page (or the whole selection when the sheet has no row key)
+            edited_ids = sheet_ids.iloc[selected_rows]
+            if key_column:
+                edited_ids = edited_ids[edited_ids.isin(list(tab_edits))]
+            baseline = apply_edits(df_selected.loc[edited_ids.index], tab_saved, edited_ids)
+            edited_df = apply_edits(baseline[shown_columns], tab_edits, edited_ids)
+            pending = prepare_save(edited_df, selected_tab, original=baseline, key_column=key_column)
+            if pending.skipped:
+                st.warning(f"⚠️ {pending.skipped} edited row(s) have no {key_column} and cannot be saved.")
+            if pending.cell_count == 0:
+                st.info("ℹ️ No changes to save.")
+            else:
+                st.session_state["save_ticket"] = save_queue.submit(pending)
+                saves_in_flight.append({"ticket": st.session_state["save_ticket"], "tab": selected_tab,
+                                        "edits": {row_id: dict(cells) for row_id, cells in tab_edits.items()
+                                                  if pending.full is not None or row_id in pending.changes}})
+                st.success(f"✅ {pending.cell_count} change(s) queued for '{pending.clear_sheet_name}' sheet.")
     except Exception as e:
         st.error(f"❌ Error saving data: {e}")
 
-# --- Save Button ---
-if st.button("💾 Save Data"):
-    save_to_google_sheet(edited_df, selected_tab)  
+# Edits already queued and unchanged since are reported by the save status instead
+queued_edits = {row_id: cells for save in saves_in_flight if save["tab"] == selected_tab
+                for row_id, cells in save["edits"].items()}
+unsaved_rows = [row_id for row_id, cells in tab_edits.items() if queued_edits.get(row_id) != cells]
+if unsaved_rows:
+    edits_caption.caption(f"✏️ {len(unsaved_rows)} edited row(s) not saved yet, across all pages.")
+
+# --- Save Status (click 🔎 or interact with the page to update) ---
+if "save_ticket" in st.session_state:
+    save_status = save_queue.status(st.session_state["save_ticket"])
+    if save_status:
+        status_col, check_col = st.columns([20, 1])
+        with status_col:
+            if save_status["state"] == "saved":
+                st.caption(f"✅ Saved to '{save_status['sheet']}' at {save_status['updated']:%H:%M:%S} "
+                           f"({save_status['cells']} cells written).")
+            elif save_status["state"] == "failed":
+                st.error(f"❌ Error saving data to '{save_status['sheet']}': {save_status['error']}")
+            elif save_status["state"] == "retrying":
+                st.caption(f"🔁 Google Sheets is busy, retrying save to '{save_status['sheet']}' "
+                           f"(attempt {save_status['attempts']}).")
+            else:
+                st.caption(f"⏳ Saving to '{save_status['sheet']}'...")
+        with check_col:
+            st.button("🔎", help="Check save status", key="save_status_button")
 
 
-# Save the selected tab's data to the relevant "Clear" sheet     modify this code with the main google sheet with the file path "G:\Shared drives\list 10\All_Sheets.xlsx"
\ No newline at end of file
+# ---------------------------------------------------------------------------------------------
+# 7️⃣ Export the Current View
+# ---------------------------------------------------------------------------------------------
+# The export is written in the background (see ExportJobs in csm_data), so the page stays usable meanwhile
+with st.expander("⬇️ Export"):
+    export_rows = narrow_selection(df_selected, selected_rows, filter_choices)
+    format_col, export_col = st.columns([3, 2])
+    with format_col:
+        export_format = st.selectbox("Format", list(export_formats), key="export_format")
+    with export_col:
+        if st.button(f"Export {len(export_rows)} row(s)", disabled=len(export_rows) == 0, key="export_button"):
+            st.session_state["export_ticket"] = export_jobs.submit(
+                df_selected, export_rows, shown_columns, export_format,
+                f"{selected_tab} {logic_id} {datetime.now():%Y-%m-%d %H%M}")
+
+    export_status = export_jobs.status(st.session_state.get("export_ticket"))
+    if export_status:
+        if export_status["state"] == "ready":
+            st.download_button(f"💾 Download {export_status['file_name']}",
+                               data=functools.partial(export_jobs.read, st.session_state["export_ticket"]),
+                               file_name=export_status["file_name"], mime=export_status["mime"], on_click="ignore")
+        elif export_status["state"] == "failed":
+            st.error(f"❌ Export failed: {export_status['error']}")
+        else:
+            status_col, check_col = st.columns([20, 1])
+            with status_col:
+                st.caption(f"⏳ Exporting {export_status['format']}: {export_status['rows']} of "
+                           f"{export_status['total']} rows written...")
+            with check_col:
+                st.button("🔎", help="Check export status", key="export_status_button")
+
+
+# --- Performance Panel (admins only) ---
+perf_run = perf.end(perf_session, tab=selected_tab, user_type=user_type_column, rows=total_rows,
+                    session_bytes=session_memory.usage(perf_session))
+if is_admin(logic_id) and perf_run:
+    with st.sidebar.expander("⏱️ Performance"):
+        st.caption(f"This rerun: {perf_run['total_ms']:.0f} ms, {perf_run['api_calls']} API call(s), "
+                   f"{perf_run['bytes'] / 1024:.0f} KB fetched")
+        memory = session_memory.totals()
+        st.caption(f"Session memory: {perf_run['session_bytes'] / 1024:.1f} KB of "
+                   f"{SESSION_MEMORY_BUDGET / 1048576:.0f} MB ({memory['sessions']} session(s), "
+                   f"{memory['bytes'] / 1048576:.1f} MB in all)")
+        st.dataframe(pd.DataFrame(list(perf_run["stages"].items()), columns=["stage", "ms"]), hide_index=True)
+        if PREWARM and prewarmer.last_run:
+            failed = ", ".join(prewarmer.last_errors)
+            st.caption(f"Last pre-warm: {prewarmer.last_run:%H:%M:%S} ({prewarmer.last_duration:.1f} s)"
+                       + (f", ⚠️ failed: {failed}" if failed else ""))
+        st.caption(f"Recent reruns (process totals: {perf.totals['api_calls']} API calls, "
+                   f"{perf.totals['bytes'] / 1048576:.1f} MB)")
+        st.dataframe(perf.stage_table(), hide_index=True)
+
+
+# Save the selected tab's data to the relevant "Clear" sheet; set CSM_DATA_SOURCE=excel to read the local copy at "G:\Shared drives\list 10\All_Sheets.xlsx" instead
\ No newline at end of file
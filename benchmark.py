@@ -0,0 +1,401 @@
+"""Offline benchmark for the CSM dashboard's data layer (csm_data.py).
+
+csm_data is pointed at an in-process stand-in for the gspread spreadsheet API, filled with synthetic
+sheets shaped like the live ones, so no credentials or network are needed:
+
+    python benchmark.py                                  # 1k, 10k and 100k rows per sheet
+    python benchmark.py --rows 1000 10000 --repeat 5 --output bench.json
+    python benchmark.py --latency 150                    # add 150 ms per API call, like the live round trip
+
+Each scenario is timed ``--repeat`` times. The results are printed as a table on stderr and written as
+JSON (stdout, or ``--output``), one record per row count, scenario and target, to track regressions.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+os.environ.setdefault("CSM_PERF_LOG", "off")
+os.environ.setdefault("CSM_PREWARM", "off")
+
+import gspread
+import numpy as np
+import pandas as pd
+
+import csm_data
+from data_sources import GoogleSheetsSource, MemoryWorksheet
+
+DEFAULT_ROWS = [1_000, 10_000, 100_000]
+
+
+
+# -----------------------------------------------------------------------------------------------------------------
+# --- Fake gspread Backend ---
+# -----------------------------------------------------------------------------------------------------------------
+
+class FakeSpreadsheet:
+    """Stand-in for gspread.Spreadsheet: the values and worksheet calls csm_data makes, served from memory.
+
+    Ranges are honoured the way the Sheets API does (whole rows, whole columns, trailing blanks trimmed),
+    so column projection and batching behave as they would live. ``calls`` counts API calls, and each
+    one sleeps ``latency`` seconds.
+    """
+
+    def __init__(self, sheets, latency=0.0):
+        self.sheets = {name: FakeWorksheet(self, name, rows) for name, rows in sheets.items()}
+        self.latency = latency
+        self.calls = 0
+
+    def _call(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _values(self, range_name):
+        name, cells = _split_range(range_name)
+        if name not in self.sheets:
+            raise gspread.exceptions.WorksheetNotFound(name)
+        return _slice(self.sheets[name]._values, cells)
+
+    def values_get(self, range_name, params=None):
+        self._call()
+        return {"range": range_name, "values": self._values(range_name)}
+
+    def values_batch_get(self, ranges, params=None):
+        self._call()
+        return {"valueRanges": [{"range": r, "values": self._values(r)} for r in ranges]}
+
+    def worksheet(self, title):
+        self._call()
+        if title not in self.sheets:
+            raise gspread.exceptions.WorksheetNotFound(title)
+        return self.sheets[title]
+
+    def add_worksheet(self, title, rows, cols):
+        self._call()
+        self.sheets[title] = FakeWorksheet(self, title)
+        return self.sheets[title]
+
+
+class FakeWorksheet(MemoryWorksheet):
+    """A worksheet of a FakeSpreadsheet: reads and writes are API calls, counted and delayed like the others."""
+
+    def __init__(self, spreadsheet, title, values=None):
+        super().__init__(title, values)
+        self.spreadsheet = spreadsheet
+
+    def get_all_values(self):
+        self.spreadsheet._call()
+        return super().get_all_values()
+
+    def update(self, values, range_name=None, **kwargs):
+        self.spreadsheet._call()
+        return super().update(values, range_name, **kwargs)
+
+    def batch_update(self, data, **kwargs):
+        self.spreadsheet._call()
+        return super().batch_update(data, **kwargs)
+
+    def append_rows(self, rows, **kwargs):
+        self.spreadsheet._call()
+        return super().append_rows(rows, **kwargs)
+
+
+class FakeClient:
+    """What GoogleSheetsSource needs from SheetsClient."""
+
+    def __init__(self, spreadsheet):
+        self.spreadsheet = spreadsheet
+
+
+def _split_range(range_name):
+    """("Sheet name", "A:C") from "'Sheet name'!A:C" (cells is "" for a whole sheet)."""
+    name, cells = range_name, ""
+    if "!" in range_name and "'" not in range_name.rpartition("!")[2]:
+        name, _, cells = range_name.rpartition("!")
+    if name.startswith("'") and name.endswith("'"):
+        name = name[1:-1].replace("''", "'")
+    return name, cells
+
+
+def _slice(values, cells):
+    if cells:
+        first, _, last = cells.partition(":")
+        if first.isdigit():
+            values = values[int(first) - 1:int(last or first)]
+        else:
+            start = gspread.utils.a1_to_rowcol(first + "1")[1] - 1
+            stop = gspread.utils.a1_to_rowcol((last or first) + "1")[1]
+            values = [row[start:stop] for row in values]
+
+    # Like the API: trailing empty cells and rows are left out
+    trimmed = []
+    for row in values:
+        if row and row[-1] == "":
+            end = len(row)
+            while end and row[end - 1] == "":
+                end -= 1
+            row = row[:end]
+        trimmed.append(row)
+    while trimmed and not trimmed[-1]:
+        trimmed.pop()
+    return trimmed
+
+
+
+# -----------------------------------------------------------------------------------------------------------------
+# --- Synthetic Sheets ---
+# -----------------------------------------------------------------------------------------------------------------
+
+NATIONS = {"north": ["N1", "N2", "N3"], "south": ["S1", "S2", "S3"], "east": ["E1", "E2"], "west": ["W1", "W2", "W3"]}
+CSMS_PER_ZONE = 20
+ALL_INDIA_ID = "india"
+
+# Columns of each tab besides Id, Nation, Zone, CSM Updated, All India and the editable ones; the tab's
+# sorting column (ageing) is added from csm_data.sorting_column
+tab_shapes = {
+    "Open - Complaint - SR": ["Ticket No", "Customer Name", "City", "Product", "Complaint Type", "Status"],
+    "Open Sites": ["Site ID", "Customer Name", "City", "Product", "Stage"],
+    "Stock Liquidation Project": ["Project Code", "Customer Name", "Material", "Quantity"],
+    "Drawing Hold Status": ["Drawing No", "Customer Name", "Hold Reason"],
+    "FG Status": ["Order No", "Customer Name", "Material", "Quantity"],
+    "Reorder": ["Order No", "Customer Name", "Product", "Reorder Value"],
+    "Appreciation": [col for col in csm_data.testimonial_columns if col not in ("Id", "Zone")]
+                    + ["Feedback", "Photo Link", "Approved By"],   # the last three are not shown
+}
+
+vocabulary = ["Alpha", "Bravo", "Charlie", "Delta", "Echo", "Foxtrot", "Golf", "Hotel", "India", "Juliet"]
+
+
+def make_people():
+    """(csm, zone, nation) for every CSM, CSMS_PER_ZONE in each zone."""
+    return [(f"csm{nation[0]}{zone}{i:02d}".lower(), zone, nation)
+            for nation, zones in NATIONS.items() for zone in zones for i in range(CSMS_PER_ZONE)]
+
+
+def generate_sheet(tab, rows, people, rng):
+    """Header plus ``rows`` rows of text shaped like ``tab``'s worksheet, with a blank row every 50."""
+    owners = np.array(people, dtype=object)[rng.integers(0, len(people), rows)]
+    columns = {
+        "Id": np.array([f"{tab[:2].upper()}{i:07d}" for i in range(rows)], dtype=object),
+        "Nation": owners[:, 2],
+        "Zone": owners[:, 1],
+        "CSM Updated": owners[:, 0],
+    }
+    for col in tab_shapes[tab]:
+        if col in ("Quantity", "Reorder Value"):
+            columns[col] = rng.integers(1, 5000, rows).astype(str).astype(object)
+        elif col in ("Date",):
+            columns[col] = _dates(rows, rng, blank_share=0.0)
+        elif col == "CSM Names":
+            columns[col] = owners[:, 0]
+        else:
+            columns[col] = np.array(vocabulary, dtype=object)[rng.integers(0, len(vocabulary), rows)]
+    if tab in csm_data.sorting_column:
+        columns[csm_data.sorting_column[tab]] = rng.integers(0, 60, rows).astype(str).astype(object)
+    columns["Clearance Date"] = _dates(rows, rng, blank_share=0.7)
+    columns["Remarks"] = np.where(rng.random(rows) < 0.2, "Follow up", "").astype(object)
+    columns["Support Required"] = np.full(rows, "", dtype=object)
+    columns["All India"] = np.full(rows, ALL_INDIA_ID, dtype=object)
+
+    values = [list(columns)] + np.column_stack(list(columns.values())).tolist()
+    blank = [""] * len(columns)
+    for i in range(len(values) - 1, 1, -50):
+        values.insert(i, list(blank))
+    return values
+
+
+def _dates(rows, rng, blank_share):
+    base = date.today()
+    days = rng.integers(-30, 30, rows)
+    text = np.array([(base + timedelta(days=int(d))).isoformat() for d in days], dtype=object)
+    return np.where(rng.random(rows) < blank_share, "", text).astype(object)
+
+
+def generate_spreadsheet(rows, seed=0):
+    """``{worksheet name: values}`` for every tab in sheet_mapping plus the Users sheet."""
+    rng = np.random.default_rng(seed)
+    people = make_people()
+    sheets = {csm_data.sheet_mapping[tab]: generate_sheet(tab, rows, people, rng) for tab in tab_shapes}
+    sheets["Users"] = [["CSM Updated", "Nation", "All India", "Name"]] + [
+        [csm, nation, ALL_INDIA_ID, csm.upper()] for csm, _, nation in people]
+    return sheets, people
+
+
+
+# -----------------------------------------------------------------------------------------------------------------
+# --- Scenarios ---
+# -----------------------------------------------------------------------------------------------------------------
+
+def reset(spreadsheet):
+    """A cold process: empty sheet cache, no parsed fingerprints, no cached header rows."""
+    csm_data.sheet_cache = csm_data.SheetCache(ttl=csm_data.sheet_ttl)
+    csm_data._parsed.clear()
+    csm_data.data_source = GoogleSheetsSource(FakeClient(spreadsheet))
+
+
+def measure(results, rows, scenario, target, repeat, fn, spreadsheet, setup=None):
+    """Times ``fn()`` ``repeat`` times (after ``setup()``, untimed) and appends a result record."""
+    timings, calls = [], []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        before = spreadsheet.calls
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+        calls.append(spreadsheet.calls - before)
+    results.append({
+        "rows": rows, "scenario": scenario, "target": target, "repeats": repeat,
+        "median_ms": round(statistics.median(timings), 3), "min_ms": round(min(timings), 3),
+        "max_ms": round(max(timings), 3), "api_calls": max(calls),
+    })
+
+
+def switch_tab(tab, user):
+    """What a rerun does for a tab besides drawing widgets: load, filter, sort, page and style."""
+    df = csm_data.load_data(csm_data.sheet_mapping[tab])
+    rows = csm_data.user_selection("benchmark", tab, df, "CSM Updated", user)
+    page = df[csm_data.display_columns(tab, df)].take(rows[:csm_data.DEFAULT_PAGE_SIZE])
+    csm_data.highlight_frame(page, tab)
+
+
+def build_sidebar(user, nation):
+    """The sidebar's dropdown options and the summary counts over every tab."""
+    for tab, sheet_name in csm_data.sheet_mapping.items():
+        df = csm_data.load_data(sheet_name)
+        summary = csm_data.get_sheet_summary(tab, df, "CSM Updated")
+        summary.nations(user), summary.zones(user, "All"), summary.csms(user, "All"), summary.count(user)
+        csm_data.get_sheet_summary(tab, df, "Nation").count(nation)
+
+
+def check_saved(spreadsheet, clear_sheet_name, key_column, edits):
+    """Raises if the Clear sheet does not hold every edited cell (``{row key: {column: value}}``) as text."""
+    values = spreadsheet.sheets[clear_sheet_name]._values
+    header = values[0]
+    rows = {row[header.index(key_column)]: row for row in values[1:]}
+    for key, cells in edits.items():
+        for col, value in cells.items():
+            written = rows[key][header.index(col)] if key in rows else None
+            if written != csm_data.cell_text(value):
+                raise AssertionError(f"{clear_sheet_name}: {key} {col} saved as {written!r}, not {value!r}")
+
+
+def run(rows, repeat, latency):
+    sheets, people = generate_spreadsheet(rows)
+    spreadsheet = FakeSpreadsheet(sheets, latency=latency)
+    sheet_names = list(csm_data.sheet_mapping.values())
+    user, _, nation = people[0]
+    results = []
+    reset(spreadsheet)
+
+    # Loading: every sheet cold (one load_data per sheet, then one batch), warm and after a refresh
+    for sheet_name in sheet_names:
+        measure(results, rows, "cold_load", sheet_name, repeat,
+                lambda: csm_data.load_data(sheet_name), spreadsheet, setup=lambda: reset(spreadsheet))
+    measure(results, rows, "cold_load", "all sheets (batched)", repeat,
+            lambda: csm_data.load_sheets(sheet_names + ["Users"]), spreadsheet, setup=lambda: reset(spreadsheet))
+    measure(results, rows, "warm_rerun", "all sheets", repeat,
+            lambda: [csm_data.load_data(sheet_name) for sheet_name in sheet_names], spreadsheet)
+    measure(results, rows, "refresh_unchanged", "all sheets", repeat,
+            lambda: csm_data.load_sheets(sheet_names + ["Users"]), spreadsheet,
+            setup=csm_data.sheet_cache.invalidate)
+
+    # Login: the first lookup builds the login index, later ones are set lookups
+    def forget_indexes():
+        csm_data.sheet_cache._derived.clear()
+        csm_data.session_memory._sessions.clear()
+
+    measure(results, rows, "login_lookup", "cold (builds index)", repeat,
+            lambda: [csm_data.get_users_by_type(user_type) for user_type in csm_data.login_types],
+            spreadsheet, setup=forget_indexes)
+    measure(results, rows, "login_lookup", "warm", repeat,
+            lambda: user in csm_data.get_users_by_type("CSM Updated"), spreadsheet)
+
+    # Tab switch and sidebar, with the per-user indexes cold and warm
+    for tab in csm_data.sheet_mapping:
+        measure(results, rows, "tab_switch_cold", tab, repeat, lambda: switch_tab(tab, user), spreadsheet,
+                setup=forget_indexes)
+        measure(results, rows, "tab_switch_warm", tab, repeat, lambda: switch_tab(tab, user), spreadsheet)
+    measure(results, rows, "sidebar_build", "cold", repeat, lambda: build_sidebar(user, nation), spreadsheet,
+            setup=forget_indexes)
+    measure(results, rows, "sidebar_build", "warm", repeat, lambda: build_sidebar(user, nation), spreadsheet)
+
+    # Save: ten edited rows of the user's complaints (remarks and clearance dates, put together the way the
+    # page does), first into a new Clear sheet, then as a diff; each save is checked against the Clear sheet
+    tab = "Open - Complaint - SR"
+    df = csm_data.load_data(csm_data.sheet_mapping[tab])
+    key_column = csm_data.row_key_column(df)
+    ids = csm_data.get_row_ids(tab, df, key_column).iloc[csm_data.user_selection("benchmark", tab, df, "CSM Updated", user)[:10]]
+    columns = csm_data.display_columns(tab, df)
+    counter = iter(range(1_000_000))
+
+    def save():
+        n = next(counter)
+        edits = {row_id: {"Remarks": f"Checked {n}", "Clearance Date": date(2026, 1, 1) + timedelta(days=n % 365)}
+                 for row_id in ids}
+        edited = csm_data.apply_edits(df.loc[ids.index, columns], edits, ids)
+        csm_data.write_save(csm_data.prepare_save(edited, tab, original=df))
+        check_saved(spreadsheet, csm_data.clear_sheet_for(tab), key_column, edits)
+
+    def drop_clear_sheet():
+        spreadsheet.sheets.pop(csm_data.clear_sheet_for(tab), None)
+
+    measure(results, rows, "save", "new clear sheet", repeat, save, spreadsheet, setup=drop_clear_sheet)
+    measure(results, rows, "save", "changed cells", repeat, save, spreadsheet)
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS, help="rows per sheet")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per scenario (median reported)")
+    parser.add_argument("--latency", type=float, default=0.0, help="milliseconds added to every API call")
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    args = parser.parse_args(argv)
+    csm_data.run_headless()
+
+    results = []
+    for rows in args.rows:
+        print(f"--- {rows:,} rows per sheet ---", file=sys.stderr)
+        size_results = run(rows, args.repeat, args.latency / 1000)
+        print(pd.DataFrame(size_results).drop(columns=["rows", "repeats"]).to_string(index=False), file=sys.stderr)
+        results += size_results
+
+    report = {
+        "meta": {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "latency_ms": args.latency,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1960 @@
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict, deque
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from urllib.parse import quote
+
+import streamlit as st
+import gspread
+import numpy as np
+import pandas as pd
+import requests
+from google.auth.transport.requests import Request
+from gspread.utils import rowcol_to_a1
+from requests.adapters import HTTPAdapter
+
+from data_sources import ExcelSource, GoogleSheetsSource, MemorySource, ParquetSource, cell_text, fingerprint
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+except ImportError:  # snapshots and Parquet exports are disabled without pyarrow
+    pa = feather = pq = None
+
+# --------------------------------------------------------------------------------------------------------
+# Data layer for app5.py
+#
+# Streamlit re-executes app5.py from the top on every widget interaction, so anything defined there is
+# rebuilt on each rerun. This module is imported once per server process, which makes it the place for
+# state that must be shared by all reruns and sessions (the Sheets client and the sheet cache below).
+# --------------------------------------------------------------------------------------------------------
+
+
+#----------------------------------------------------------------------------------------------------------
+# --- Performance Instrumentation ------------------------------------------------------------------------
+#----------------------------------------------------------------------------------------------------------
+
+# One JSON object per rerun (and per background load or save) is appended here, keeping at most one rotated
+# file besides it (see PerfRecorder.LOG_MAX_BYTES); CSM_PERF_LOG=off disables it
+PERF_LOG = os.environ.get("CSM_PERF_LOG", os.path.join(os.path.dirname(os.path.abspath(__file__)), "perf.jsonl"))
+
+# Logic IDs (any login type) that see the performance panel, e.g. CSM_ADMINS="a123,b456"
+admin_ids = [logic_id.strip().lower() for logic_id in os.environ.get("CSM_ADMINS", "").split(",") if logic_id.strip()]
+
+
+def is_admin(logic_id):
+    return logic_id is not None and str(logic_id).strip().lower() in admin_ids
+
+
+class PerfRecorder:
+    """Stage timings per rerun (or background job), API call and byte counts, and a JSON-lines log.
+
+    ``begin(run_key)`` opens a run on the calling thread, ``with perf.stage(name):`` blocks on that thread
+    add to it, and ``end(run_key)`` closes it and appends it to the log. A run left open by st.stop() or
+    st.rerun() is closed (as incomplete) by the next ``begin`` with the same key. API calls are counted
+    toward the process totals and the run open on the calling thread, if any.
+    """
+
+    RECENT = 200
+
+    # Runs still open after this many seconds belong to sessions that stopped rerunning (e.g. ended on the
+    # login page's st.stop()); the next begin closes them as incomplete
+    STALE_OPEN = 30 * 60
+
+    # Once the log reaches this size it is moved to "<log>.1" (replacing the previous one) and started afresh
+    LOG_MAX_BYTES = 20 * 1024 * 1024
+
+    def __init__(self, log_path=None):
+        self.log_path = None if log_path == "off" else log_path
+        self.totals = {"api_calls": 0, "bytes": 0}
+        self.recent = deque(maxlen=self.RECENT)     # closed runs, newest last
+        self._open = {}                             # run key -> run
+        self._local = threading.local()             # .run: the run open on this thread
+        self._lock = threading.Lock()
+
+    def begin(self, run_key, kind="rerun", **fields):
+        self.end(run_key, complete=False)
+        cutoff = time.perf_counter() - self.STALE_OPEN
+        for stale_key in [key for key, run in list(self._open.items()) if run["_started"] < cutoff]:
+            self.end(stale_key, complete=False)
+        run = {"time": datetime.now().isoformat(timespec="seconds"), "kind": kind, **fields,
+               "stages": {}, "api_calls": 0, "bytes": 0, "_started": time.perf_counter()}
+        self._open[run_key] = run
+        self._local.run = run
+        return run
+
+    def end(self, run_key, complete=True, **fields):
+        """Closes the run, logs it and returns it (None if no run is open under ``run_key``)."""
+        run = self._open.pop(run_key, None)
+        if run is None:
+            return None
+        if getattr(self._local, "run", None) is run:
+            self._local.run = None
+        run.update(fields, complete=complete)
+        run["total_ms"] = round((time.perf_counter() - run.pop("_started")) * 1000, 1)
+        run["stages"] = {name: round(seconds * 1000, 1) for name, seconds in run["stages"].items()}
+        with self._lock:
+            self.recent.append(run)
+            self._write(run)
+        return run
+
+    @contextmanager
+    def job(self, kind, **fields):
+        """A run for background work on the current thread (pre-warming, revalidation, queued saves).
+
+        Yields the run, so the job can add fields to what is logged.
+        """
+        run_key = (kind, threading.get_ident())
+        run = self.begin(run_key, kind=kind, **fields)
+        try:
+            yield run
+        finally:
+            self.end(run_key)
+
+    @contextmanager
+    def stage(self, name):
+        """Times the block into the current thread's run; a stage entered several times adds up."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            run = getattr(self._local, "run", None)
+            if run is not None:
+                run["stages"][name] = run["stages"].get(name, 0.0) + time.perf_counter() - started
+
+    def count_request(self, nbytes):
+        with self._lock:
+            self.totals["api_calls"] += 1
+            self.totals["bytes"] += nbytes
+        run = getattr(self._local, "run", None)
+        if run is not None:
+            run["api_calls"] += 1
+            run["bytes"] += nbytes
+
+    def stage_table(self, kind="rerun"):
+        """Per stage over the recent complete runs of ``kind``: runs seen in, median and max milliseconds."""
+        runs = [run for run in self.recent if run["kind"] == kind and run["complete"]]
+        rows = {}
+        for run in runs:
+            for name, ms in list(run["stages"].items()) + [("total", run["total_ms"])]:
+                rows.setdefault(name, []).append(ms)
+        return pd.DataFrame([{"stage": name, "runs": len(ms), "median ms": float(np.median(ms)), "max ms": max(ms)}
+                             for name, ms in rows.items()])
+
+    def _write(self, run):
+        if not self.log_path:
+            return
+        try:
+            if os.path.exists(self.log_path) and os.path.getsize(self.log_path) >= self.LOG_MAX_BYTES:
+                os.replace(self.log_path, f"{self.log_path}.1")
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(run, default=str) + "\n")
+        except OSError:
+            pass    # the log is best effort
+
+
+perf = PerfRecorder(PERF_LOG)
+
+
+def _count_response(response, *args, **kwargs):
+    perf.count_request(len(response.content))
+
+
+
+#----------------------------------------------------------------------------------------------------------
+# --- Authenticate using Service Account JSON ------------------------------------------------------------
+#----------------------------------------------------------------------------------------------------------
+
+SERVICE_ACCOUNT_FILE = r"G:\My Drive\Colab Notebooks\voltaic-mantra-402407-7dfb4640ec7b.json"
+SPREADSHEET_KEY = "13lD9l0vvEspPtgb-efKch6m5Cjap-5OtyR48XsqZDTs"
+
+
+class SheetsClient:
+    """One authenticated gspread client for the whole server process, shared by every session.
+
+    Nothing is read or opened until first use. All calls go through a single pooled keep-alive HTTP
+    session, the OAuth token is refreshed ahead of expiry instead of on a failed request, and the
+    spreadsheet handle is opened once and reused.
+    """
+
+    TOKEN_REFRESH_MARGIN = timedelta(minutes=5)
+
+    def __init__(self, key_file, spreadsheet_key, pool_size=32, timeout=(10, 60)):
+        self.key_file = key_file
+        self.spreadsheet_key = spreadsheet_key
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._gc = None
+        self._spreadsheet = None
+        self._lock = threading.RLock()
+
+    @property
+    def gc(self):
+        if self._gc is None:
+            with self._lock:
+                if self._gc is None:
+                    with perf.stage("auth"):
+                        gc = gspread.service_account(filename=self.key_file)
+                    # Size the connection pool for concurrent sessions; requests keeps connections alive
+                    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size)
+                    gc.http_client.session.mount("https://", adapter)
+                    gc.http_client.session.hooks["response"].append(_count_response)
+                    gc.http_client.set_timeout(self.timeout)
+                    self._gc = gc
+        self._refresh_token_if_due()
+        return self._gc
+
+    @property
+    def spreadsheet(self):
+        if self._spreadsheet is None:
+            with self._lock:
+                if self._spreadsheet is None:
+                    with perf.stage("auth"):
+                        self._spreadsheet = self.gc.open_by_key(self.spreadsheet_key)
+        else:
+            self._refresh_token_if_due()
+        return self._spreadsheet
+
+    def _refresh_token_if_due(self):
+        credentials = getattr(self._gc.http_client, "auth", None)
+        expiry = getattr(credentials, "expiry", None)
+        if expiry is None or expiry - _utcnow() > self.TOKEN_REFRESH_MARGIN:
+            return
+        with self._lock:
+            # Re-check: another thread may have refreshed while we waited
+            if credentials.expiry - _utcnow() <= self.TOKEN_REFRESH_MARGIN:
+                with perf.stage("auth"):
+                    credentials.refresh(Request())
+
+
+def _utcnow():
+    # google-auth stores token expiry as naive UTC
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+sheets_client = SheetsClient(SERVICE_ACCOUNT_FILE, SPREADSHEET_KEY)
+
+
+# --- Data Source ---
+# Where the worksheets are read from (and Clear sheets written to): "sheets" for the live spreadsheet,
+# "excel" for a local copy of the workbook, "parquet" for one Parquet file per worksheet, or "memory" for
+# an empty in-memory spreadsheet (offline use; fill it through data_source.set_values).
+# Set CSM_DATA_SOURCE to switch without editing this file.
+DATA_SOURCE = os.environ.get("CSM_DATA_SOURCE", "sheets")
+EXCEL_WORKBOOK = os.environ.get("CSM_EXCEL_WORKBOOK", r"G:\Shared drives\list 10\All_Sheets.xlsx")
+PARQUET_DIR = os.environ.get("CSM_PARQUET_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "parquet"))
+
+
+def make_data_source(kind):
+    if kind == "sheets":
+        return GoogleSheetsSource(sheets_client)
+    if kind == "excel":
+        return ExcelSource(EXCEL_WORKBOOK)
+    if kind == "parquet":
+        return ParquetSource(PARQUET_DIR)
+    if kind == "memory":
+        return MemorySource()
+    raise ValueError(f"Unknown data source '{kind}' (expected 'sheets', 'excel', 'parquet' or 'memory')")
+
+
+data_source = make_data_source(DATA_SOURCE)
+
+
+
+# --- Sheet Mapping ---
+sheet_mapping = {
+    "Open - Complaint - SR": "Complaint-Final",
+    "Open Sites": "Open-Sites-Final",
+    "Stock Liquidation Project": "Project Stock at Site-Final",
+    "Drawing Hold Status": "WCS-Final",
+    "FG Status": "FG-Final",
+    "Reorder": "Reorder",
+    "Appreciation": "Testimonial"
+}
+
+# Columns to select for Testimonial sheet only
+testimonial_columns = [
+    'CSM Names', 'Date', 'Month', 'Id', 'RE Name', 'Zone', 'Customer Name',
+    'City', 'Segment', 'Product', 'MSC ID', 'Testimonial Type'
+]
+
+# Columns users may edit in the table
+editable_columns = ["Clearance Date", "Remarks", "Support Required"]
+
+# --- Column Projection ---
+# Columns the login filter and the sidebar counts rely on; a tab whose sheet lacks one fails to load
+required_columns = ["Nation", "Zone", "CSM Updated"]
+
+# Columns each tab shows, in order. Only these are fetched, together with the required, login, editable,
+# row key and ageing columns; tabs not listed here fetch every column and show all but the first three.
+tab_columns = {
+    "Appreciation": testimonial_columns,
+}
+
+# --- Sorting & Highlighting ---
+# Mapping for sorting columns (sorted high to low)
+sorting_column = {
+    "Open - Complaint - SR": "Ticket Ageing",
+    "Open Sites": "Aging",
+    "Stock Liquidation Project": "Aging",
+    "Drawing Hold Status": "Hold Age",
+    "FG Status": "Aging"
+}
+
+# Row highlighting by ageing: rows below "limit" in "column" are green, at or above it red
+ageing_thresholds = {
+    "Open - Complaint - SR": {"column": "Ticket Ageing", "limit": 20},
+    "Open Sites": {"column": "Aging", "limit": 25},
+    "Stock Liquidation Project": {"column": "Aging", "limit": 25},
+}
+
+highlight_colors = {
+    "below": "background-color: lightgreen",
+    "above": "background-color: lightcoral",
+}
+
+# --- Local Snapshots ---
+# Last good copy of every sheet, served at startup and whenever Google Sheets cannot be reached
+SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "snapshots")
+
+# --- Column Types ---
+# Applied once at load time. Every sheet gets common_schema; sheet_schema adds per-tab columns.
+common_schema = {
+    "date": ["Clearance Date"],
+    "category": ["Nation", "Zone", "CSM Updated", "All India"],
+}
+
+sheet_schema = {
+    "Open - Complaint - SR": {"numeric": ["Ticket Ageing"]},
+    "Open Sites": {"numeric": ["Aging"]},
+    "Stock Liquidation Project": {"numeric": ["Aging"]},
+    "Drawing Hold Status": {"numeric": ["Hold Age"]},
+    "FG Status": {"numeric": ["Aging"]},
+}
+
+
+def tab_for(sheet_name):
+    """The tab a worksheet (e.g. "Complaint-Final") is shown under, or the name itself if it has none."""
+    return next((key for key, sheet in sheet_mapping.items() if sheet == sheet_name), sheet_name)
+
+
+def columns_for(sheet_name):
+    """Columns to fetch from a worksheet, or None for all of them."""
+    tab = tab_for(sheet_name)
+    if tab not in tab_columns:
+        return None
+    ageing = [sorting_column[tab]] if tab in sorting_column else []
+    return list(dict.fromkeys(tab_columns[tab] + required_columns + login_types + editable_columns
+                              + row_key_columns + ageing))
+
+
+def display_columns(tab, df):
+    """Columns shown in the editor for a tab's rows."""
+    if tab not in tab_columns:
+        return df.columns[3:]
+    return [col for col in dict.fromkeys(tab_columns[tab] + editable_columns) if col in df.columns]
+
+
+def schema_for(sheet_name):
+    """Column types for a worksheet (e.g. "Complaint-Final"), merging common_schema with its tab's entry."""
+    tab = tab_for(sheet_name)
+    extra = sheet_schema.get(tab, {})
+    return {kind: common_schema.get(kind, []) + extra.get(kind, []) for kind in ("numeric", "date", "category")}
+
+# --- Cache Freshness (seconds) ---
+# How long a loaded worksheet is served from memory before the next read goes back to Google Sheets.
+# Keyed by worksheet name; anything not listed uses DEFAULT_TTL.
+DEFAULT_TTL = 15 * 60
+
+sheet_ttl = {
+    "Complaint-Final": 5 * 60,      # updated through the day
+    "Open-Sites-Final": 10 * 60,
+    "Testimonial": 60 * 60,
+    "Users": 60 * 60,
+}
+
+# --- Background Pre-warming ---
+# One thread per server process reloads every sheet at each of prewarm_times (local "HH:MM", ahead of the
+# shift start) and checks every PREWARM_INTERVAL seconds for sheets about to expire, so users only ever
+# read sheets and indexes that are already built. Set CSM_PREWARM=off to disable it.
+PREWARM = os.environ.get("CSM_PREWARM", "on") != "off"
+prewarm_times = ["08:45"]
+PREWARM_INTERVAL = 2 * 60
+
+# --- Per-Session Memory ---
+# Each session keeps only row positions into the shared frames (its sorted selection of each tab). Past
+# SESSION_MEMORY_BUDGET bytes a session's least recently used selections are dropped, and sessions idle for
+# SESSION_IDLE_TTL seconds lose all of theirs; both are rebuilt on demand. Set with CSM_SESSION_MEMORY_MB.
+SESSION_MEMORY_BUDGET = int(os.environ.get("CSM_SESSION_MEMORY_MB", "16")) * 1024 * 1024
+SESSION_IDLE_TTL = 30 * 60
+
+
+
+# -----------------------------------------------------------------------------------------------------------------
+# 2️⃣ Load Data from Google Sheets
+# -----------------------------------------------------------------------------------------------------------------
+
+class MissingColumnsError(ValueError):
+    """A tab's worksheet lacks columns the page cannot work without."""
+
+    def __init__(self, sheet_name, columns):
+        self.sheet_name = sheet_name
+        self.columns = columns
+        super().__init__(f"Sheet '{sheet_name}' is missing required column(s): {', '.join(columns)}")
+
+
+def _frame_from_values(sheet_name, data):
+    """Turns raw worksheet values into a typed frame with only non-empty rows and columns.
+
+    Everything is done with whole-array operations, and columns are coerced to the sheet's schema once
+    here so the page never has to re-parse them on a rerun.
+    """
+    if isinstance(data, pd.DataFrame):
+        # Columnar sources (Parquet) already have a header and typed columns
+        df = data.set_axis(pd.Index(data.columns.astype(str)).str.strip(), axis=1)
+        df = df[(df.notna() & df.ne("")).any(axis=1)].reset_index(drop=True)
+        if df.empty:
+            return pd.DataFrame()
+    else:
+        if not data:
+            return pd.DataFrame()
+
+        values = np.array(data, dtype=object)
+
+        # Remove completely empty rows
+        values = values[(values != "").any(axis=1)]
+
+        if len(values) == 0:
+            return pd.DataFrame()
+
+        # Set the first row as header
+        df = pd.DataFrame(values[1:], columns=pd.Index(values[0]).str.strip())
+
+    # Remove completely empty columns
+    df = df.dropna(axis=1, how="all")
+
+    # Keep only the tab's columns (e.g. testimonial_columns for 'Testimonial'), in case the source
+    # could not project them itself
+    columns = columns_for(sheet_name)
+    if columns is not None:
+        df = df[[col for col in df.columns if col in columns]]
+
+    if sheet_name in sheet_mapping.values():
+        missing = [col for col in required_columns if col not in df.columns]
+        if missing:
+            raise MissingColumnsError(sheet_name, missing)
+
+    # Add optional columns if missing
+    for col in ["Clearance Date", "Remarks", "Support Required"]:
+        if col not in df.columns:
+            df[col] = ""
+
+    return _apply_schema(df, schema_for(sheet_name))
+
+
+def _apply_schema(df, schema):
+    """Coerces the schema's columns in place; columns the sheet doesn't have are skipped."""
+    for col in schema.get("numeric", []):
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype("float32")
+
+    for col in schema.get("date", []):
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col], errors="coerce")
+
+    for col in schema.get("category", []):
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+
+    return df
+
+
+# Last parse of every sheet: sheet name -> (fingerprint of the raw values, frame)
+_parsed = {}
+
+
+def _parse(sheet_name, data):
+    """``_frame_from_values``, skipped when the raw values are unchanged since the sheet was last parsed.
+
+    An unchanged sheet gets back the very frame it had, so the sheet cache keeps it (and everything
+    derived from it, such as the row indexes and summary counts) instead of rebuilding.
+    """
+    with perf.stage(f"parse:{sheet_name}"):
+        key = fingerprint(data)
+        last = _parsed.get(sheet_name)
+        if last is not None and last[0] == key:
+            return last[1]
+
+        df = _frame_from_values(sheet_name, data)
+        _parsed[sheet_name] = (key, df)
+        return df
+
+
+def _read_sheet(sheet_name):
+    """Fetches one worksheet from the configured data source. Raises if it cannot be read."""
+    with perf.stage(f"fetch:{sheet_name}"):
+        data = data_source.read_sheet(sheet_name, columns_for(sheet_name))
+    return _parse(sheet_name, data)
+
+
+def _read_sheets(sheet_names, errors):
+    """Fetches several worksheets with one call to the data source (a single batched values request for
+    Google Sheets, one pass over the workbook for a local file).
+
+    If the batch call fails (one bad tab name fails the whole request), each sheet is retried on its own
+    with ``_read_sheet``. Sheets that still fail are left out of the result and recorded in ``errors``.
+    """
+    try:
+        with perf.stage("fetch:batch"):
+            values = data_source.read_many(sheet_names, {name: columns_for(name) for name in sheet_names})
+    except Exception:
+        values = {}
+
+    frames = {}
+    for name in sheet_names:
+        try:
+            if name in values:
+                frames[name] = _parse(name, values[name])
+            else:
+                frames[name] = _read_sheet(name)
+        except Exception as e:
+            errors[name] = e
+    return frames
+
+
+def _show_load_error(sheet_name, e):
+    if isinstance(e, MissingColumnsError):
+        st.error(f"⚠️ {e}")
+        return
+    st.markdown(f"<p style='font-size:8px; color: red;'>⚠️ Unable to load sheet: {sheet_name}. ({e})</p>",
+                unsafe_allow_html=True)
+
+
+def run_headless():
+    """For scripts using this module outside a running app (benchmark.py, digest.py): the st.* messages
+    the loaders and savers show would otherwise each log a "missing ScriptRunContext" warning."""
+    from streamlit import config, logger
+
+    config.get_option("global.showWarningOnDirectExecution")    # parse the config before overriding it
+    config.set_option("global.showWarningOnDirectExecution", False)
+    logger.set_log_level("error")
+
+
+def load_data(sheet_name):
+    """Loads only non-empty rows and the tab's columns (see tab_columns) from the data source.
+
+    Served from ``sheet_cache`` while the sheet is fresh, so reruns do no network I/O.
+    """
+    try:
+        return sheet_cache.get(sheet_name, _read_sheet)
+
+    except Exception as e:
+        _show_load_error(sheet_name, e)
+        return pd.DataFrame()
+
+
+def load_sheets(sheet_names):
+    """Loads several sheets at once, fetching every stale one in a single batched request.
+
+    Returns ``{sheet_name: DataFrame}`` in the order given; sheets that fail to load map to an empty frame.
+    """
+    errors = {}
+    frames = sheet_cache.get_many(sheet_names, lambda names: _read_sheets(names, errors), errors)
+
+    # Only failures of this call are reported: sheets that failed recently are not retried (or reported)
+    # again until SheetCache.FAILURE_TTL has passed
+    for sheet_name, e in errors.items():
+        if sheet_name not in frames:    # failures covered by a snapshot stay quiet
+            _show_load_error(sheet_name, e)
+
+    return {name: frames.get(name, pd.DataFrame()) for name in sheet_names}
+
+
+
+
+class LazySheets(Mapping):
+    """Tab name -> loaded frame, fetching a tab's worksheet only the first time it is looked up.
+
+    ``tab in sheets`` is true only for tabs whose sheet has data, as with the old eager ``df_mapping``;
+    a tab that failed to load or is empty maps to an empty frame. Loaded frames come from (and stay in)
+    ``sheet_cache``, so a new LazySheets on the next rerun is cheap.
+    """
+
+    def __init__(self, mapping):
+        self._mapping = mapping
+        self._frames = {}
+
+    def __getitem__(self, tab):
+        if tab not in self._mapping:
+            raise KeyError(tab)
+        if tab not in self._frames:
+            self._frames[tab] = load_data(self._mapping[tab])
+        return self._frames[tab]
+
+    def __contains__(self, tab):
+        return tab in self._mapping and not self[tab].empty
+
+    def __iter__(self):
+        return iter(self._mapping)
+
+    def __len__(self):
+        return len(self._mapping)
+
+    def prefetch(self, tabs):
+        """Loads every not-yet-loaded tab in ``tabs`` with one batched request."""
+        missing = [tab for tab in tabs if tab in self._mapping and tab not in self._frames]
+        if missing:
+            frames = load_sheets([self._mapping[tab] for tab in missing])
+            for tab in missing:
+                self._frames[tab] = frames[self._mapping[tab]]
+
+
+# -----------------------------------------------------------------------------------------------------------------
+# --- Sheet Cache (shared by all reruns and sessions) ---
+# -----------------------------------------------------------------------------------------------------------------
+
+class SnapshotStore:
+    """Last good copy of each sheet on local disk, so the app can start (and keep running) without the API.
+
+    Snapshots are uncompressed Arrow IPC (Feather v2) files, which keep the load-time column types and
+    read back without parsing. Without pyarrow installed the store is simply disabled.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    @property
+    def enabled(self):
+        return feather is not None
+
+    def _path(self, sheet_name):
+        return os.path.join(self.directory, quote(sheet_name, safe="") + ".arrow")
+
+    def save(self, sheet_name, df):
+        """Writes ``df`` as the snapshot of ``sheet_name``; returns False if it could not be written."""
+        if not self.enabled or df.empty:
+            return False
+        path = self._path(sheet_name)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            feather.write_feather(df.reset_index(drop=True), tmp_path, compression="uncompressed")
+            os.replace(tmp_path, path)  # readers never see a half-written file
+            return True
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+
+    def load(self, sheet_name):
+        """``(frame, saved at)`` for the snapshot of ``sheet_name``, or None if there is no usable one."""
+        path = self._path(sheet_name)
+        if not self.enabled or not os.path.exists(path):
+            return None
+        try:
+            df = feather.read_table(path).to_pandas()
+            return df, datetime.fromtimestamp(os.path.getmtime(path))
+        except Exception:
+            return None
+
+
+class _Entry:
+    __slots__ = ("df", "loaded_at", "loaded_time", "ttl", "source", "retry_at", "expired")
+
+    def __init__(self, df, ttl, loaded_time=None, source="sheets"):
+        self.df = df
+        self.loaded_at = time.monotonic()
+        self.loaded_time = loaded_time or datetime.now()
+        self.ttl = ttl
+        self.source = source        # "sheets" (live) or "snapshot"
+        self.retry_at = 0.0         # snapshot entries: earliest time for the next revalidation attempt
+        self.expired = False        # set by SheetCache.invalidate
+
+    def fresh(self):
+        return self.source == "sheets" and not self.expired and time.monotonic() - self.loaded_at < self.ttl
+
+
+class SheetCache:
+    """Process-wide store of loaded worksheets with a per-sheet TTL.
+
+    With a SnapshotStore, every successful load is also persisted to disk and the cache serves stale
+    data while it revalidates: the first read of a sheet in a new process returns its snapshot at once
+    and reloads it in the background, and a failed load falls back to the snapshot instead of raising.
+
+    Frames handed out are shared between sessions, so callers must not modify them in place. Sessions hold
+    row positions into them rather than copies (see user_selection); under pandas' copy-on-write, frames
+    taken or sliced from a shared frame copy their data only when they are written to.
+    """
+
+    # How long to wait before retrying the source for a sheet that is being served from its snapshot
+    SNAPSHOT_RETRY = 60
+
+    # How long a failed load is remembered before the source is tried again (the refresh buttons retry at once)
+    FAILURE_TTL = 60
+
+    def __init__(self, ttl=None, default_ttl=DEFAULT_TTL, snapshots=None):
+        self.ttl = dict(ttl or {})
+        self.default_ttl = default_ttl
+        self.snapshots = snapshots
+        self._entries = {}          # sheet name -> _Entry
+        self._loaded = set()        # sheets loaded from the source at least once in this process
+        self._revalidating = set()  # sheets with a background reload in flight
+        self._refreshing = set()    # sheets being reloaded by refresh()
+        self._failures = {}         # sheet name -> (error, time of the failed load), see FAILURE_TTL
+        self._locks = {}            # sheet name -> lock, so concurrent misses fetch once
+        self._guard = threading.Lock()
+        self._refreshed = threading.Condition(self._guard)     # notified when a refresh() swaps its frames in
+        self._batch_lock = threading.Lock()     # one batched fetch at a time
+        self._derived = {}          # key -> [(weak refs to the source frames, value)], newest first, see derived()
+
+    def ttl_for(self, sheet_name):
+        return self.ttl.get(sheet_name, self.default_ttl)
+
+    def _lock_for(self, sheet_name):
+        with self._guard:
+            return self._locks.setdefault(sheet_name, threading.Lock())
+
+    def _fresh(self, sheet_name):
+        entry = self._entries.get(sheet_name)
+        return entry if entry and entry.fresh() else None
+
+    def _failed(self, sheet_name):
+        """The error of a load of ``sheet_name`` that failed less than FAILURE_TTL ago, or None."""
+        failure = self._failures.get(sheet_name)
+        return failure[0] if failure and time.monotonic() - failure[1] < self.FAILURE_TTL else None
+
+    def _store(self, sheet_name, df):
+        self._failures.pop(sheet_name, None)
+        previous = self._entries.get(sheet_name)
+        self._entries[sheet_name] = _Entry(df, self.ttl_for(sheet_name))
+        self._loaded.add(sheet_name)
+        # A reload that returned the frame already held means the sheet has not changed
+        if self.snapshots is not None and (previous is None or previous.df is not df):
+            self.snapshots.save(sheet_name, df)
+
+    def _from_snapshot(self, sheet_name):
+        """Puts the sheet's snapshot in the cache and returns its entry, or None if there is none."""
+        snapshot = self.snapshots.load(sheet_name) if self.snapshots is not None else None
+        if snapshot is None:
+            return None
+        entry = _Entry(snapshot[0], self.ttl_for(sheet_name), loaded_time=snapshot[1], source="snapshot")
+        self._entries[sheet_name] = entry
+        return entry
+
+    def _stale_entry(self, sheet_name):
+        """A snapshot entry to serve while the sheet is reloaded in the background, if that applies."""
+        entry = self._entries.get(sheet_name)
+        if entry is None and sheet_name not in self._loaded:
+            entry = self._from_snapshot(sheet_name)     # first read in this process
+        return entry if entry is not None and entry.source == "snapshot" else None
+
+    def _servable(self, sheet_name):
+        """An entry to serve without loading: fresh, a snapshot (to revalidate), or one refresh() is replacing."""
+        entry = self._fresh(sheet_name) or self._stale_entry(sheet_name)
+        if entry is None and sheet_name in self._refreshing:
+            entry = self._entries.get(sheet_name)
+        return entry
+
+    def _wait_for_refresh(self, sheet_names):
+        """Blocks while refresh() is loading any of ``sheet_names``."""
+        with self._refreshed:
+            while any(name in self._refreshing for name in sheet_names):
+                self._refreshed.wait()
+
+    def _revalidate(self, sheet_names, batch_loader):
+        """Reloads snapshot-served sheets on a background thread (at most once per SNAPSHOT_RETRY each)."""
+        now = time.monotonic()
+        with self._guard:
+            sheet_names = [name for name in sheet_names if name not in self._revalidating
+                           and now >= getattr(self._entries.get(name), "retry_at", 0.0)]
+            self._revalidating.update(sheet_names)
+        if not sheet_names:
+            return
+
+        def run():
+            try:
+                with perf.job("revalidate", sheets=sheet_names):
+                    loaded = batch_loader(sheet_names)
+                for sheet_name, df in loaded.items():
+                    self._store(sheet_name, df)
+            except Exception:
+                pass    # keep serving the snapshot; retried after SNAPSHOT_RETRY
+            finally:
+                with self._guard:
+                    self._revalidating.difference_update(sheet_names)
+                    for sheet_name in sheet_names:
+                        entry = self._entries.get(sheet_name)
+                        if entry is not None and entry.source == "snapshot":
+                            entry.retry_at = time.monotonic() + self.SNAPSHOT_RETRY
+
+        threading.Thread(target=run, name="sheet-revalidate", daemon=True).start()
+
+    def get(self, sheet_name, loader):
+        """Returns the cached frame for ``sheet_name``, calling ``loader(sheet_name)`` only when stale.
+
+        Errors raised by the loader propagate unless a snapshot can be served, and are raised again without
+        calling the loader for FAILURE_TTL seconds.
+        """
+        entry = self._servable(sheet_name)
+        if entry:
+            if entry.source == "snapshot" and sheet_name not in self._refreshing:
+                self._revalidate([sheet_name], lambda names: {name: loader(name) for name in names})
+            return entry.df
+
+        self._wait_for_refresh([sheet_name])
+        with self._lock_for(sheet_name):
+            # Another session (or a refresh) may have reloaded it while we waited
+            entry = self._servable(sheet_name)
+            if entry:
+                return entry.df
+            error = self._failed(sheet_name)
+            if error is not None:
+                raise error
+
+            try:
+                df = loader(sheet_name)
+            except Exception as e:
+                self._failures[sheet_name] = (e, time.monotonic())
+                entry = self._from_snapshot(sheet_name)
+                if entry is None:
+                    raise
+                return entry.df
+
+            self._store(sheet_name, df)
+            return df
+
+    def get_many(self, sheet_names, batch_loader, errors=None):
+        """Returns ``{sheet_name: frame}`` for every sheet that is cached, could be loaded or has a snapshot.
+
+        All stale sheets are handed to ``batch_loader(names)`` in one call, which returns a dict of the
+        frames it managed to load; sheets missing from that dict are not cached. Fresh frames, snapshots
+        and frames a refresh is replacing are returned without waiting for any load in flight.
+
+        ``errors`` is the dict ``batch_loader`` records its failures in (sheet name -> exception). Failed
+        sheets are not handed to the loader again for FAILURE_TTL seconds.
+        """
+        frames, revalidate = {}, []
+        for sheet_name in sheet_names:
+            entry = self._servable(sheet_name)
+            if entry:
+                frames[sheet_name] = entry.df
+                if entry.source == "snapshot" and sheet_name not in self._refreshing:
+                    revalidate.append(sheet_name)
+
+        missing = [name for name in sheet_names if name not in frames]
+        if missing:
+            self._wait_for_refresh(missing)
+            with self._batch_lock:
+                stale = []
+                for sheet_name in missing:
+                    entry = self._servable(sheet_name)
+                    if entry:
+                        frames[sheet_name] = entry.df
+                    elif self._failed(sheet_name) is None:
+                        stale.append(sheet_name)
+
+                if stale:
+                    loaded = batch_loader(stale)
+                    for sheet_name, df in loaded.items():
+                        self._store(sheet_name, df)
+                    frames.update(loaded)
+
+                    for sheet_name in stale:
+                        if sheet_name in loaded:
+                            continue
+                        error = (errors or {}).get(sheet_name) or LookupError(f"Sheet '{sheet_name}' could not be loaded")
+                        self._failures[sheet_name] = (error, time.monotonic())
+                        if entry := self._from_snapshot(sheet_name):
+                            frames[sheet_name] = entry.df
+
+        if revalidate:
+            self._revalidate(revalidate, batch_loader)
+        return frames
+
+    def invalidate(self, sheet_name=None):
+        """Expires one sheet (or every sheet when ``sheet_name`` is None) so the next read refetches it.
+
+        The frame is kept until then: if the sheet turns out unchanged, the loader hands back the same
+        frame and nothing derived from it is rebuilt. Remembered failures are forgotten, so it is retried.
+        """
+        with self._guard:
+            if sheet_name is None:
+                self._failures.clear()
+            else:
+                self._failures.pop(sheet_name, None)
+            entries = self._entries.values() if sheet_name is None else [self._entries.get(sheet_name)]
+            for entry in entries:
+                if entry is not None:
+                    entry.expired = True
+
+    # Versions of each derived value kept, so one built ahead of a swap does not evict the one in use
+    DERIVED_VERSIONS = 2
+
+    def derived(self, key, frames, builder):
+        """Returns ``builder(*frames)``, built once per loaded version of ``frames``.
+
+        The cache hands out the same frame object until a sheet is reloaded, so the result is reused
+        for as long as every source frame is the identical object it was built from. Source frames are
+        only weakly referenced: a version whose frames are gone (say a session's filtered copy) is dropped
+        instead of keeping them alive.
+        """
+        def built_from(refs):
+            return len(refs) == len(frames) and all((ref is None) == (frame is None) and (ref is None or ref() is frame)
+                                                    for ref, frame in zip(refs, frames))
+
+        versions = self._derived[key] = [(refs, value) for refs, value in self._derived.get(key, [])
+                                         if all(ref is None or ref() is not None for ref in refs)]
+        for refs, value in versions:
+            if built_from(refs):
+                return value
+
+        value = builder(*frames)
+        refs = tuple(None if frame is None else weakref.ref(frame) for frame in frames)
+        self._derived[key] = [(refs, value)] + versions[:self.DERIVED_VERSIONS - 1]
+        return value
+
+    def refresh(self, sheet_names, batch_loader, prepare=None, errors=None):
+        """Reloads ``sheet_names`` now, whether stale or not, and swaps the new frames in.
+
+        ``prepare(frames)`` runs on the new frames before any of them is served, to build what is derived
+        from them; until the swap, readers keep getting the previous frames, even once they are stale.
+        Returns the frames loaded. Sheets that could not be loaded (see ``errors`` in ``get_many``) are
+        remembered as failed for FAILURE_TTL seconds.
+
+        No lock is held while loading: only reads of sheets with no frame at all wait for the refresh
+        (and then find them loaded) instead of fetching them a second time.
+        """
+        sheet_names = list(sheet_names)
+        with self._guard:
+            self._refreshing.update(sheet_names)
+        try:
+            try:
+                loaded = batch_loader(sheet_names)
+            except Exception as e:
+                for sheet_name in sheet_names:
+                    self._failures[sheet_name] = (e, time.monotonic())
+                raise
+            if prepare is not None and loaded:
+                prepare(loaded)
+            for sheet_name, df in loaded.items():
+                self._store(sheet_name, df)
+            for sheet_name in sheet_names:
+                if sheet_name not in loaded:
+                    error = (errors or {}).get(sheet_name) or LookupError(f"Sheet '{sheet_name}' could not be loaded")
+                    self._failures[sheet_name] = (error, time.monotonic())
+        finally:
+            with self._refreshed:
+                self._refreshing.difference_update(sheet_names)
+                self._refreshed.notify_all()
+        return loaded
+
+    def peek(self, sheet_name):
+        """The cached frame for ``sheet_name`` (fresh or not) without loading it, or None."""
+        entry = self._entries.get(sheet_name)
+        return None if entry is None else entry.df
+
+    def expires_in(self, sheet_name):
+        """Seconds until ``sheet_name`` goes stale; 0 if it is stale, expired or not cached."""
+        entry = self._fresh(sheet_name)
+        return 0.0 if entry is None else max(0.0, entry.ttl - (time.monotonic() - entry.loaded_at))
+
+    def loaded_at(self, sheet_name):
+        """Wall-clock time ``sheet_name`` was last loaded from the source, or None if it is not cached.
+
+        For a sheet served from its snapshot, this is when the snapshot was saved.
+        """
+        entry = self._entries.get(sheet_name)
+        return None if entry is None else entry.loaded_time
+
+    def source(self, sheet_name):
+        """"sheets" or "snapshot" for a cached sheet, None otherwise."""
+        entry = self._entries.get(sheet_name)
+        return None if entry is None else entry.source
+
+
+sheet_cache = SheetCache(ttl=sheet_ttl, snapshots=SnapshotStore(SNAPSHOT_DIR))
+
+
+
+# -----------------------------------------------------------------------------------------------------------------
+# --- Login Index ---
+# -----------------------------------------------------------------------------------------------------------------
+
+# Login types offered on the login page; each is also the column holding that type's Logic IDs
+login_types = ["CSM Updated", "Nation", "All India"]
+
+# The sheet whose rows define who may log in
+login_sheet = "Drawing Hold Status"
+
+
+def normalize_logic_id(logic_id):
+    return str(logic_id).strip().lower()
+
+
+def build_login_index(login_df, users_df=None):
+    """Maps each login type to the frozenset of normalized Logic IDs allowed to log in with it.
+
+    IDs come from the login sheet and, when it has a column named after the login type, the Users sheet.
+    Only the distinct values of each column are touched, so this is cheap even for large sheets.
+    """
+    index = {}
+    for user_type in login_types:
+        ids = set()
+        for df in (login_df, users_df):
+            if df is not None and user_type in df.columns:
+                ids.update(normalize_logic_id(v) for v in df[user_type].dropna().unique())
+        ids.discard("")
+        index[user_type] = frozenset(ids)
+    return index
+
+
+def get_login_index(login_df, users_df=None):
+    """The login index for the currently loaded frames, rebuilt only after one of them is reloaded."""
+    return sheet_cache.derived("login_index", (login_df, users_df), build_login_index)
+
+
+def get_users_by_type(user_type):
+    """Normalized Logic IDs allowed to log in as ``user_type`` (a set lookup, no DataFrame work).
+
+    Loads the login and Users sheets in one batch if they are not cached yet.
+    """
+    frames = load_sheets([sheet_mapping[login_sheet], "Users"])
+    users_df = frames["Users"]
+    login_df = frames[sheet_mapping[login_sheet]]
+    return get_login_index(login_df, users_df if not users_df.empty else None).get(user_type, frozenset())
+
+
+
+# -----------------------------------------------------------------------------------------------------------------
+# --- Per-User Row Index ---
+# -----------------------------------------------------------------------------------------------------------------
+
+_NO_ROWS = np.array([], dtype=np.intp)
+
+
+def build_partition_index(df, column):
+    """Maps each normalized value of ``column`` to the row positions holding it."""
+    keys = df[column].map(normalize_logic_id, na_action="ignore")
+    return df.groupby(np.asarray(keys), sort=False).indices
+
+
+def get_partition_index(tab, df, column):
+    """The partition index of ``tab``'s loaded frame for ``column``, rebuilt only after a reload."""
+    return sheet_cache.derived(("partition", tab, column), (df,), lambda d: build_partition_index(d, column))
+
+
+def user_row_positions(tab, df, column, logic_id):
+    """Row positions in ``df`` (the frame loaded for ``tab``) whose ``column`` matches ``logic_id``.
+
+    The partition index behind this is built once per loaded frame and column, so each lookup costs
+    time proportional to the user's rows rather than to the sheet.
+    """
+    if column not in df.columns:
+        return _NO_ROWS
+    return get_partition_index(tab, df, column).get(normalize_logic_id(logic_id), _NO_ROWS)
+
+
+def sorted_positions(tab, df, positions):
+    """``positions`` ordered by ``tab``'s ageing column, highest first (empty values last).
+
+    Only that one column of the selected rows is read; the rows themselves are never copied.
+    """
+    sort_col = sorting_column.get(tab)
+    if sort_col not in df.columns or len(positions) < 2:
+        return positions
+    values = df[sort_col].take(positions).reset_index(drop=True)
+    order = values.sort_values(ascending=False, kind="stable", na_position="last").index.to_numpy()
+    return positions[order]
+
+
+def narrow_selection(df, positions, choices):
+    """The ``positions`` whose row matches every ``{column: value}`` of ``choices`` ("All" matches anything)."""
+    for column, value in choices.items():
+        if value != "All" and column in df.columns and len(positions):
+            positions = positions[(df[column].take(positions) == value).to_numpy(dtype=bool, na_value=False)]
+    return positions
+
+
+
+# -----------------------------------------------------------------------------------------------------------------
+# --- Per-Session Selections ---
+# -----------------------------------------------------------------------------------------------------------------
+
+def _nbytes(value):
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(np.sum(value.memory_usage(deep=True)))
+    return sys.getsizeof(value)
+
+
+class SessionMemory:
+    """Values derived for one session (e.g. its sorted row selection), held under a per-session byte budget.
+
+    Like SheetCache.derived, a value is rebuilt once any frame it came from is reloaded; the frames are
+    only referenced weakly, so a session never keeps an old load of a sheet alive. A session over
+    ``budget`` drops its least recently used values, and sessions not seen for ``idle_ttl`` seconds are
+    forgotten altogether.
+    """
+
+    def __init__(self, budget=SESSION_MEMORY_BUDGET, idle_ttl=SESSION_IDLE_TTL):
+        self.budget = budget
+        self.idle_ttl = idle_ttl
+        self._sessions = {}         # session -> _SessionState
+        self._lock = threading.Lock()
+
+    def touch(self, session):
+        """Marks ``session`` as active and forgets sessions idle for longer than ``idle_ttl``."""
+        now = time.monotonic()
+        with self._lock:
+            for idle in [key for key, state in self._sessions.items() if now - state.seen > self.idle_ttl]:
+                del self._sessions[idle]
+            state = self._sessions.setdefault(session, _SessionState())
+            state.seen = now
+            return state
+
+    def get(self, session, key, frames, builder):
+        """Returns ``builder(*frames)`` for ``session``, reused while every frame is the one it was built from."""
+        state = self.touch(session)
+        with self._lock:
+            held = state.values.get(key)
+            if held is not None and len(held[0]) == len(frames) and all(ref() is df for ref, df in zip(held[0], frames)):
+                state.values.move_to_end(key)
+                return held[1]
+
+        value = builder(*frames)
+        with self._lock:
+            state.values[key] = (tuple(weakref.ref(df) for df in frames), value, _nbytes(value))
+            state.values.move_to_end(key)
+            while len(state.values) > 1 and state.nbytes() > self.budget:
+                state.values.popitem(last=False)
+        return value
+
+    def usage(self, session):
+        """Bytes held for ``session``."""
+        state = self._sessions.get(session)
+        return 0 if state is None else state.nbytes()
+
+    def totals(self):
+        """``{"sessions": n, "bytes": total}`` across every session held."""
+        with self._lock:
+            return {"sessions": len(self._sessions), "bytes": sum(s.nbytes() for s in self._sessions.values())}
+
+
+class _SessionState:
+    __slots__ = ("seen", "values")
+
+    def __init__(self):
+        self.seen = time.monotonic()
+        self.values = OrderedDict()     # key -> (weak refs to source frames, value, bytes), oldest first
+
+    def nbytes(self):
+        return sum(nbytes for _, _, nbytes in self.values.values())
+
+
+session_memory = SessionMemory()
+
+
+def user_selection(session, tab, df, column, logic_id):
+    """Row positions in ``df`` of the user's rows, sorted as the page shows them; kept per session.
+
+    Pages and saves take their rows from the shared frame by these positions, so a session never holds
+    its own copy of the selection.
+    """
+    return session_memory.get(
+        session, ("selection", tab, column, normalize_logic_id(logic_id)), (df,),
+        lambda d: _build_selection(tab, d, column, logic_id),
+    )
+
+
+def _build_selection(tab, df, column, logic_id):
+    positions = user_row_positions(tab, df, column, logic_id)
+    with perf.stage("sort"):
+        return sorted_positions(tab, df, positions)
+
+
+
+# -----------------------------------------------------------------------------------------------------------------
+# --- Nation → Zone → CSM Hierarchy and Summary Counts ---
+# -----------------------------------------------------------------------------------------------------------------
+
+hierarchy_levels = ["Nation", "Zone", "CSM Updated"]
+
+
+class SheetSummary:
+    """Row counts of one sheet by login value and Nation → Zone → CSM Updated, built once per load.
+
+    ``tree[login][nation][zone][csm]`` is the number of rows whose ``user_column`` (normalized) is ``login``.
+    Everything the sidebar needs is read from this tree, so its cost depends on the number of distinct
+    combinations, not on the number of rows.
+    """
+
+    def __init__(self, df, user_column):
+        self.tree = {}
+        if df.empty or user_column not in df.columns:
+            return
+
+        keys = [df[user_column].map(normalize_logic_id, na_action="ignore").rename("login")]
+        keys += [df[col] if col in df.columns else pd.Series(np.nan, index=df.index, name=col)
+                 for col in hierarchy_levels]
+        counts = df.groupby(keys, observed=True, dropna=False, sort=False).size()
+
+        for (login, nation, zone, csm), count in counts.items():
+            self.tree.setdefault(login, {}).setdefault(nation, {}).setdefault(zone, {})[csm] = int(count)
+
+    def _zones(self, logic_id, nation="All"):
+        nations = self.tree.get(normalize_logic_id(logic_id), {})
+        return [zones for name, zones in nations.items() if nation == "All" or name == nation]
+
+    def nations(self, logic_id):
+        return _sorted_present(self.tree.get(normalize_logic_id(logic_id), {}))
+
+    def zones(self, logic_id, nation="All"):
+        return _sorted_present(zone for zones in self._zones(logic_id, nation) for zone in zones)
+
+    def csms(self, logic_id, zone="All"):
+        return _sorted_present(csm for zones in self._zones(logic_id) for name, csms in zones.items()
+                               if zone == "All" or name == zone for csm in csms)
+
+    def count(self, logic_id, nation="All", zone="All", csm="All"):
+        """Rows for ``logic_id``, optionally rolled up to one Nation, Zone or CSM."""
+        return sum(count for zones in self._zones(logic_id, nation) for name, csms in zones.items()
+                   if zone == "All" or name == zone
+                   for csm_name, count in csms.items() if csm == "All" or csm_name == csm)
+
+
+def _sorted_present(values):
+    return sorted({value for value in values if not pd.isna(value)})
+
+
+def get_sheet_summary(tab, df, user_column):
+    """The SheetSummary of ``tab``'s loaded frame for ``user_column``, rebuilt only after a reload."""
+    return sheet_cache.derived(("summary", tab, user_column), (df,), lambda d: SheetSummary(d, user_column))
+
+
+
+# -----------------------------------------------------------------------------------------------------------------
+# --- Background Pre-warming ---
+# -----------------------------------------------------------------------------------------------------------------
+
+def prebuild_indexes(frames):
+    """Builds the login, row and summary indexes for freshly loaded frames (sheet name -> frame).
+
+    Frames not in ``frames`` are taken from the cache, so the login index pairs a new login sheet with the
+    Users sheet already loaded (and the other way round).
+    """
+    with perf.stage("indexes"):
+        login_name = sheet_mapping[login_sheet]
+        if login_name in frames or "Users" in frames:
+            login_df = frames.get(login_name, sheet_cache.peek(login_name))
+            if login_df is not None:
+                get_login_index(login_df, frames.get("Users", sheet_cache.peek("Users")))
+
+        for sheet_name, df in frames.items():
+            tab = tab_for(sheet_name)
+            if tab not in sheet_mapping:
+                continue
+            for column in login_types:
+                if column in df.columns:
+                    get_partition_index(tab, df, column)
+                    get_sheet_summary(tab, df, column)
+
+
+class Prewarmer:
+    """Process-wide background refresher that keeps every sheet loaded and indexed ahead of users.
+
+    ``start`` launches one daemon thread (later calls do nothing). It loads the ``first`` sheets (the ones
+    sign-in needs) on their own, then all ``sheet_names`` at once, again at each of ``daily_at``; in
+    between, every ``interval`` seconds, it reloads the sheets that would go stale before its next check.
+    Each pass builds the frames and their indexes off the request path and only then swaps them into the
+    cache, so reruns read prebuilt data.
+    """
+
+    def __init__(self, cache, sheet_names, daily_at=(), interval=PREWARM_INTERVAL, first=()):
+        self.cache = cache
+        self.sheet_names = list(sheet_names)
+        self.first = [name for name in first if name in self.sheet_names]
+        self.daily_at = [datetime.strptime(t, "%H:%M").time() for t in daily_at]
+        self.interval = interval
+        self.last_run = None        # wall-clock time of the last pass
+        self.last_duration = None   # seconds the last pass took
+        self.last_errors = {}       # sheet name -> error from the last pass
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="sheet-prewarm", daemon=True)
+                self._thread.start()
+
+    def due(self):
+        """Sheets that are not cached or would go stale before the next check."""
+        return [name for name in self.sheet_names if self.cache.expires_in(name) <= self.interval]
+
+    def run_once(self, sheet_names=None):
+        """Reloads ``sheet_names`` (default: the ones due) and rebuilds their indexes; returns them.
+
+        Sheets whose last load failed less than SheetCache.FAILURE_TTL ago are left for a later pass.
+        """
+        sheet_names = self.due() if sheet_names is None else list(sheet_names)
+        failing = {name: self.cache._failed(name) for name in sheet_names}
+        sheet_names = [name for name, error in failing.items() if error is None]
+        if not sheet_names:
+            return []
+
+        started = time.perf_counter()
+        errors = {}
+        with perf.job("prewarm", sheets=sheet_names) as run:
+            try:
+                self.cache.refresh(sheet_names, lambda names: _read_sheets(names, errors), prepare=prebuild_indexes,
+                                   errors=errors)
+            except Exception as e:
+                errors = {name: e for name in sheet_names}
+            run["errors"] = {name: f"{type(e).__name__}: {e}" for name, e in errors.items()}
+        # Sheets skipped as still failing keep their error
+        self.last_errors = {**{name: error for name, error in failing.items() if error is not None}, **errors}
+        self.last_run = datetime.now()
+        self.last_duration = time.perf_counter() - started
+        return sheet_names
+
+    def _next_daily(self, now):
+        """The next scheduled full reload after ``now``, or None without a schedule."""
+        upcoming = []
+        for at in self.daily_at:
+            when = datetime.combine(now.date(), at)
+            upcoming.append(when if when > now else when + timedelta(days=1))
+        return min(upcoming, default=None)
+
+    def _run(self):
+        # A reader of a sheet with no frame yet waits for the pass loading it, so sign-in must not wait
+        # for a pass over every sheet
+        if self.first:
+            self.run_once(self.first)
+        self.run_once()
+        while True:
+            now = datetime.now()
+            daily = self._next_daily(now)
+            wait = self.interval if daily is None else min(self.interval, (daily - now).total_seconds())
+            time.sleep(max(wait, 0))
+            if daily is not None and datetime.now() >= daily:
+                self.run_once(self.sheet_names)
+            else:
+                self.run_once()
+
+
+prewarmer = Prewarmer(sheet_cache, list(sheet_mapping.values()) + ["Users"], daily_at=prewarm_times,
+                      first=[sheet_mapping[login_sheet], "Users"])
+
+
+
+# -----------------------------------------------------------------------------------------------------------------
+# --- Row Highlighting ---
+# -----------------------------------------------------------------------------------------------------------------
+
+def highlight_frame(df, tab, skip_columns=editable_columns):
+    """CSS for every cell of ``df`` from ``tab``'s ageing threshold, for ``Styler.apply(..., axis=None)``.
+
+    Whole-column masks pick each row's colour, and the same object array is reused for every styled
+    column (all but ``skip_columns``); rows with no ageing value stay unstyled.
+    """
+    palette = np.array(["", highlight_colors["below"], highlight_colors["above"]], dtype=object)
+    codes = np.zeros(len(df), dtype=np.intp)
+
+    rule = ageing_thresholds.get(tab)
+    if rule and rule["column"] in df.columns:
+        ageing = pd.to_numeric(df[rule["column"]], errors="coerce").to_numpy()
+        codes = np.select([ageing < rule["limit"], ageing >= rule["limit"]], [1, 2], default=0)
+
+    row_css, blank = palette[codes], palette[np.zeros(len(df), dtype=np.intp)]
+    css = pd.DataFrame({i: blank if col in skip_columns else row_css for i, col in enumerate(df.columns)},
+                       index=df.index, dtype=object)
+    css.columns = df.columns
+    return css
+
+
+# -----------------------------------------------------------------------------------------------------------------
+# --- Paged Editing ---
+# -----------------------------------------------------------------------------------------------------------------
+
+# Rows per page offered above the table ("All" shows every row in one editor)
+page_size_options = [50, 100, 250, 500, "All"]
+DEFAULT_PAGE_SIZE = 100
+
+
+def row_ids(df, key_column):
+    """A unique id for each row of ``df``: its row key text, which stays the same across reloads.
+
+    Rows whose key is blank or shared with another row, and every row of a sheet without a key column,
+    get their index label instead, so edits to one of them never land on another.
+    """
+    labels = pd.Series(df.index, index=df.index, dtype=object)
+    if key_column is None:
+        return labels
+    keys = df[key_column].map(cell_text).astype(object)
+    return keys.mask(keys.eq("") | keys.duplicated(keep=False), labels)
+
+
+def get_row_ids(tab, df, key_column):
+    """``row_ids`` of ``tab``'s whole loaded frame, shared by every session until the next reload."""
+    return sheet_cache.derived(("row_ids", tab, key_column), (df,), lambda d: row_ids(d, key_column))
+
+
+def apply_edits(df, edits, ids):
+    """Copy of ``df`` with stored edits (``{row id: {column: value}}``) put back into their rows.
+
+    ``ids`` gives the row id of each label of ``df``; rows without edits are left as they are.
+    """
+    hit = ids[ids.isin(list(edits))] if edits else ids.iloc[:0]
+    if hit.empty:
+        return df
+
+    df = df.copy()
+    for label, row_id in hit.items():
+        if label in df.index:
+            for col, value in edits[row_id].items():
+                if col in df.columns:
+                    # The editor returns plain dates; date columns of the loaded frames hold timestamps
+                    if pd.api.types.is_datetime64_any_dtype(df[col].dtype):
+                        value = pd.NaT if value is None or pd.isna(value) else pd.Timestamp(value)
+                    df.at[label, col] = value
+    return df
+
+
+def collect_edits(original, edited, ids, edits, columns=editable_columns, shown=None):
+    """Records in ``edits`` every cell of ``columns`` where the editor output differs from the page as loaded.
+
+    Only rows of this page that the editor changed are touched, compared with ``shown`` (the page the
+    editor was given, defaults to ``original``): a row edited back to its loaded value is dropped from
+    ``edits``, and every other stored edit is kept.
+    """
+    columns = [col for col in columns if col in edited.columns and col in original.columns]
+    if not columns or edited.empty:
+        return edits
+
+    before = original.loc[edited.index, columns].apply(lambda s: s.map(cell_text))
+    after = edited[columns].apply(lambda s: s.map(cell_text))
+    changed = after.ne(before)
+    if shown is not None:
+        touched = after.ne(shown.loc[edited.index, columns].apply(lambda s: s.map(cell_text))).any(axis=1)
+    else:
+        touched = changed.any(axis=1) | ids[edited.index].isin(list(edits))
+
+    for label in edited.index[touched.to_numpy()]:
+        row_id = ids[label]
+        cells = {col: edited.at[label, col] for col in columns if changed.at[label, col]}
+        if cells:
+            edits[row_id] = cells
+        else:
+            edits.pop(row_id, None)
+    return edits
+
+
+
+def settle_save(edits, saved, submitted):
+    """Moves the cells of a save that went through from ``edits`` into ``saved`` (both ``{row id: {column: value}}``).
+
+    ``submitted`` holds the edits the save was made from. ``saved`` is the session's baseline on top of the
+    rows as loaded, so saved cells are shown as they were saved and are not written again; cells edited
+    again since the save was submitted stay in ``edits``.
+    """
+    for row_id, cells in submitted.items():
+        saved.setdefault(row_id, {}).update(cells)
+        pending = edits.get(row_id)
+        if pending is None:
+            continue
+        for col, value in cells.items():
+            if col in pending and cell_text(pending[col]) == cell_text(value):
+                del pending[col]
+        if not pending:
+            del edits[row_id]
+    return edits
+
+
+# ---------------------------------------------------------------------------------------------
+# 6️⃣ Save Updated Data
+# ---------------------------------------------------------------------------------------------
+
+# Define explicit mapping of tabs to their corresponding "Clear" sheets
+clear_sheet_mapping = {
+    "Complaint File": "Complaint Clear",
+    "Open Sites Final": "Open SitesClear",
+    "Project Stock at Site-Final": "Project Stock at Site-Clear",
+    "WCS-Final": "WCS Clear",
+    "FG-Final":"FG Clear",
+    "Reorder":"Reorder Clear"
+
+}
+
+# Columns that identify a row across loads and saves, in order of preference
+row_key_columns = ["Id", "Ticket No", "Ticket Number", "SR No"]
+
+
+def clear_sheet_for(selected_tab):
+    """Get the correct "Clear" sheet name based on the selected tab."""
+    return clear_sheet_mapping.get(selected_tab, f"{selected_tab} Clear")  # Default fallback
+
+
+def row_key_column(df):
+    """The first of ``row_key_columns`` in ``df`` that can locate a row: its non-blank values are unique.
+
+    Returns None when there is none, and the whole table is saved instead. Rows with a blank key cannot
+    be located and are left out of diff saves (see ``prepare_save``).
+    """
+    for col in row_key_columns:
+        if col in df.columns:
+            keys = df[col].map(cell_text)
+            if keys[keys != ""].is_unique:
+                return col
+    return None
+
+
+def get_row_key_column(tab, df):
+    """``row_key_column`` of ``tab``'s whole loaded frame, checked once per load."""
+    return sheet_cache.derived(("row_key_column", tab), (df,), row_key_column)
+
+
+def find_changes(original, edited, key_column, columns=editable_columns, by_label=False):
+    """Cells of ``columns`` that differ between the rows as loaded and the editor output.
+
+    Rows are matched by index label (the editor keeps the index of the frame it was given) and reported
+    by their ``key_column`` value, or their index label with ``by_label``: ``{row key: {column: new text}}``.
+    """
+    columns = [col for col in columns if col in edited.columns and col in original.columns]
+    if not columns or edited.empty:
+        return {}
+
+    after = edited[columns].apply(lambda s: s.map(cell_text))
+    before = original.loc[edited.index, columns].apply(lambda s: s.map(cell_text))
+    changed = after.ne(before)
+
+    rows = changed.any(axis=1)
+    labels = edited.index[rows]
+    keys = pd.Series(labels, index=labels) if by_label else original.loc[labels, key_column].map(cell_text)
+    return {
+        key: {col: after.at[label, col] for col in columns if changed.at[label, col]}
+        for label, key in keys.items()
+    }
+
+
+class PendingSave:
+    """Cells headed for one Clear sheet, ready to be written or merged with a later save to that sheet.
+
+    In diff mode ``changes`` holds ``{row key: {column: text}}`` and ``rows`` the full text of each changed
+    row, used if the row is not in the Clear sheet yet; ``skipped`` counts changed rows left out because
+    their key is blank. Without a row key the whole table goes in ``full``.
+    """
+
+    def __init__(self, clear_sheet_name, key_column=None, columns=(), changes=None, rows=None, full=None,
+                 skipped=0):
+        self.clear_sheet_name = clear_sheet_name
+        self.key_column = key_column
+        self.columns = list(columns)
+        self.changes = changes or {}
+        self.rows = rows or {}
+        self.full = full
+        self.skipped = skipped
+
+    @property
+    def cell_count(self):
+        if self.full is not None:
+            return self.full.size
+        return sum(len(cells) for cells in self.changes.values())
+
+    def merge(self, newer):
+        """Folds a later save into this one; for any cell saved twice the newer value wins."""
+        if newer.full is not None or self.full is not None:
+            self.__dict__.update(newer.__dict__)
+            return
+        for key, cells in newer.changes.items():
+            self.changes.setdefault(key, {}).update(cells)
+        self.rows.update(newer.rows)
+        self.columns += [col for col in newer.columns if col not in self.columns]
+
+
+def prepare_save(df, selected_tab, original=None, key_column=None):
+    """Works out what saving the edited table ``df`` has to write, without any network I/O.
+
+    With ``original`` (the rows as loaded, same index as ``df``) and a row key column available, only the
+    changed editable cells are kept; otherwise the whole table is. ``key_column`` should be checked on the
+    whole sheet (``get_row_key_column``) when ``original`` holds only some of its rows.
+    """
+    clear_sheet_name = clear_sheet_for(selected_tab)
+    if key_column is None and original is not None:
+        key_column = row_key_column(original)
+    if key_column is None:
+        # Convert all datetime columns to string format to avoid serialization errors
+        return PendingSave(clear_sheet_name, full=df.astype(str))
+
+    keys = original.loc[df.index, key_column].map(cell_text)
+    keyed = (keys != "").to_numpy()
+    changes = find_changes(original, df[keyed], key_column)
+    skipped = len(find_changes(original, df[~keyed], key_column, by_label=True))
+    columns = [key_column] + [col for col in df.columns if col != key_column]
+
+    rows = {}
+    for label, key in keys[keys.isin(list(changes))].items():
+        rows[key] = {col: cell_text(df.at[label, col]) for col in df.columns}
+        rows[key][key_column] = key
+
+    return PendingSave(clear_sheet_name, key_column, columns, changes, rows, skipped=skipped)
+
+
+def write_save(pending):
+    """Writes a prepared save to its Clear sheet and returns the number of cells written.
+
+    Rows are located in the Clear sheet by the row key, so saves from different users to the same sheet
+    merge instead of overwriting each other. Changed cells go out in one batched values update; rows not
+    yet in the Clear sheet are appended in full.
+    """
+    if pending.full is not None:
+        return _save_full(pending.full, pending.clear_sheet_name)
+    if not pending.changes:
+        return 0
+
+    key_column = pending.key_column
+    sheet = data_source.clear_sheet(pending.clear_sheet_name, len(pending.rows) + 1, len(pending.columns))
+    values = sheet.get_all_values()
+
+    header = list(values[0]) if values else list(pending.columns)
+    header_changed = not values
+    for col in [key_column] + editable_columns:
+        if col in pending.columns and col not in header:
+            header.append(col)
+            header_changed = True
+    if len(header) > sheet.col_count:
+        sheet.add_cols(len(header) - sheet.col_count)
+
+    key_index = header.index(key_column)
+    row_of_key = {row[key_index]: number for number, row in enumerate(values[1:], start=2) if len(row) > key_index}
+
+    updates, appends = [], []
+    if header_changed:
+        updates.append({"range": rowcol_to_a1(1, 1), "values": [header]})
+
+    for key, cells in pending.changes.items():
+        if key in row_of_key:
+            updates.extend({"range": rowcol_to_a1(row_of_key[key], header.index(col) + 1), "values": [[text]]}
+                           for col, text in cells.items())
+        else:
+            row = {**pending.rows.get(key, {key_column: key}), **cells}
+            appends.append([row.get(col, "") for col in header])
+
+    # One batched values update for every changed cell, plus one append for rows new to the sheet
+    if updates:
+        sheet.batch_update(updates)
+    if appends:
+        sheet.append_rows(appends)
+
+    return sum(len(u["values"][0]) for u in updates) + sum(len(r) for r in appends)
+
+
+def _save_full(df, clear_sheet_name):
+    """Overwrites a Clear sheet with the whole (already stringified) frame; returns the number of cells written."""
+    sheet = data_source.clear_sheet(clear_sheet_name, df.shape[0], df.shape[1])
+
+    # Update Google Sheet with cleaned data
+    sheet.update([df.columns.values.tolist()] + df.values.tolist())
+
+    return df.size + df.shape[1]
+
+
+
+# ---------------------------------------------------------------------------------------------
+# --- Write-Behind Save Queue ---
+# ---------------------------------------------------------------------------------------------
+
+# HTTP statuses worth retrying: quota exhausted and transient server errors
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+def _is_retryable(e):
+    if isinstance(e, gspread.exceptions.APIError):
+        return getattr(e.response, "status_code", None) in RETRYABLE_STATUS
+    return isinstance(e, (requests.ConnectionError, requests.Timeout))
+
+
+class _QueuedWrite:
+    def __init__(self, pending, ticket):
+        self.pending = pending
+        self.tickets = [ticket]
+        self.attempts = 0
+        self.not_before = 0.0       # monotonic time before which it must not be retried
+
+
+class SaveQueue:
+    """Process-wide write-behind queue for saves to the "Clear" sheets.
+
+    ``submit`` returns a ticket at once. A single background thread flushes every ``flush_interval``
+    seconds, merging all saves pending for the same Clear sheet into one write, and retries quota (429)
+    and server errors with exponential backoff and full jitter. Use ``status(ticket)`` to follow a save.
+    """
+
+    MAX_TICKETS = 2000
+
+    def __init__(self, writer=write_save, flush_interval=2.0, max_attempts=8, base_delay=2.0, max_delay=64.0):
+        self.writer = writer
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._pending = {}                      # clear sheet name -> _QueuedWrite
+        self._tickets = OrderedDict()           # ticket -> status dict
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def submit(self, pending):
+        """Queues a PendingSave and returns its ticket."""
+        ticket = uuid.uuid4().hex[:12]
+        with self._cond:
+            self._set_status([ticket], "queued", sheet=pending.clear_sheet_name, cells=None, error=None, attempts=0)
+            queued = self._pending.get(pending.clear_sheet_name)
+            if queued:
+                queued.pending.merge(pending)
+                queued.tickets.append(ticket)
+            else:
+                self._pending[pending.clear_sheet_name] = _QueuedWrite(pending, ticket)
+
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="save-queue", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return ticket
+
+    def status(self, ticket):
+        """``{"state", "sheet", "cells", "error", "attempts", "updated"}`` for a ticket, or None if unknown.
+
+        ``state`` is one of queued, saving, retrying, saved or failed.
+        """
+        with self._cond:
+            status = self._tickets.get(ticket)
+            return dict(status) if status else None
+
+    def _set_status(self, tickets, state, **fields):
+        for ticket in tickets:
+            status = self._tickets.setdefault(ticket, {})
+            status.update(fields, state=state, updated=datetime.now())
+        while len(self._tickets) > self.MAX_TICKETS:
+            self._tickets.popitem(last=False)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    wake = min((queued.not_before for queued in self._pending.values()), default=None)
+                    if wake is not None and wake <= now:
+                        break
+                    self._cond.wait(None if wake is None else wake - now)
+
+            # Give saves arriving together a moment to merge into one write
+            time.sleep(self.flush_interval)
+
+            with self._cond:
+                now = time.monotonic()
+                due = [self._pending.pop(name) for name, queued in list(self._pending.items())
+                       if queued.not_before <= now]
+                for queued in due:
+                    self._set_status(queued.tickets, "saving")
+
+            for queued in due:
+                self._flush(queued)
+
+    def _flush(self, queued):
+        try:
+            with perf.job("save", sheet=queued.pending.clear_sheet_name), perf.stage("save:write"):
+                cells = self.writer(queued.pending)
+        except Exception as e:
+            queued.attempts += 1
+            with self._cond:
+                if _is_retryable(e) and queued.attempts < self.max_attempts:
+                    # Saves that arrived meanwhile are newer, so they are merged on top of the failed one
+                    newer = self._pending.pop(queued.pending.clear_sheet_name, None)
+                    if newer:
+                        queued.pending.merge(newer.pending)
+                        queued.tickets += newer.tickets
+                    delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (queued.attempts - 1)))
+                    queued.not_before = time.monotonic() + delay
+                    self._pending[queued.pending.clear_sheet_name] = queued
+                    self._set_status(queued.tickets, "retrying", error=str(e), attempts=queued.attempts)
+                    self._cond.notify()
+                else:
+                    self._set_status(queued.tickets, "failed", error=str(e), attempts=queued.attempts)
+            return
+
+        with self._cond:
+            self._set_status(queued.tickets, "saved", cells=cells, error=None, attempts=queued.attempts + 1)
+
+
+save_queue = SaveQueue()
+
+
+
+# ---------------------------------------------------------------------------------------------
+# 7️⃣ Export the Current View
+# ---------------------------------------------------------------------------------------------
+
+# Exports are written here in the background and deleted EXPORT_KEEP seconds after they finish
+EXPORT_DIR = os.path.join(tempfile.gettempdir(), "csm_exports")
+EXPORT_CHUNK_ROWS = 5000
+EXPORT_KEEP = 30 * 60
+
+
+def write_csv(chunks, path):
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        for i, chunk in enumerate(chunks):
+            chunk.to_csv(f, header=i == 0, index=False, date_format="%Y-%m-%d")
+
+
+def write_excel(chunks, path):
+    import openpyxl
+
+    # A write-only workbook streams its rows to disk instead of keeping every cell in memory
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet("Export")
+    for i, chunk in enumerate(chunks):
+        if i == 0:
+            sheet.append(list(chunk.columns))
+        for col in chunk.columns:
+            if pd.api.types.is_datetime64_any_dtype(chunk[col]):
+                chunk[col] = chunk[col].dt.date
+        chunk = chunk.astype(object).where(chunk.notna(), None)
+        for row in chunk.itertuples(index=False, name=None):
+            sheet.append(row)
+    workbook.save(path)
+
+
+def write_parquet(chunks, path):
+    writer = None
+    try:
+        for chunk in chunks:
+            if writer is None:
+                schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+                # Columns that are empty in the first chunk carry no type yet; they hold sheet text
+                schema = pa.schema([field.with_type(pa.string()) if pa.types.is_null(field.type) else field
+                                    for field in schema], metadata=schema.metadata)
+                writer = pq.ParquetWriter(path, schema)
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+# Format -> (file extension, MIME type, writer); Parquet needs pyarrow
+export_formats = {
+    "CSV": ("csv", "text/csv", write_csv),
+    "Excel": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", write_excel),
+}
+if pq is not None:
+    export_formats["Parquet"] = ("parquet", "application/vnd.apache.parquet", write_parquet)
+
+
+class ExportJobs:
+    """Process-wide background exports of a row selection to CSV, Excel or Parquet files.
+
+    ``submit`` returns a ticket at once and a small thread pool writes the file, taking the rows from the
+    shared frame by position ``chunk_rows`` at a time, so an export holds one chunk in memory whatever the
+    size of the selection. Use ``status(ticket)`` to follow it and ``read(ticket)`` to get the finished file.
+    """
+
+    MAX_TICKETS = 2000
+
+    def __init__(self, directory=EXPORT_DIR, chunk_rows=EXPORT_CHUNK_ROWS, keep=EXPORT_KEEP, workers=2):
+        self.directory = directory
+        self.chunk_rows = chunk_rows
+        self.keep = keep
+        self._tickets = OrderedDict()           # ticket -> status dict
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="export")
+
+    def submit(self, df, positions, columns, fmt, name):
+        """Queues an export of ``df``'s rows at ``positions`` (in that order) and returns its ticket.
+
+        ``name`` is the download file name without extension.
+        """
+        extension, mime, _ = export_formats[fmt]
+        ticket = uuid.uuid4().hex[:12]
+        os.makedirs(self.directory, exist_ok=True)
+        self._remove_expired()
+        with self._lock:
+            self._set_status(ticket, "queued", format=fmt, rows=0, total=len(positions), error=None, mime=mime,
+                             file_name=f"{name}.{extension}", path=os.path.join(self.directory, f"{ticket}.{extension}"))
+        self._pool.submit(self._export, ticket, df, positions, list(columns), fmt)
+        return ticket
+
+    def status(self, ticket):
+        """``{"state", "format", "rows", "total", "file_name", "mime", "error", "updated"}`` for a ticket, or None.
+
+        ``state`` is one of queued, exporting, ready or failed; ``rows`` counts the rows written so far.
+        """
+        with self._lock:
+            status = self._tickets.get(ticket)
+            return dict(status) if status else None
+
+    def read(self, ticket):
+        """The contents of ``ticket``'s finished export file."""
+        status = self.status(ticket)
+        if status is None or status["state"] != "ready":
+            raise FileNotFoundError(f"Export {ticket} is not available")
+        with open(status["path"], "rb") as f:
+            return f.read()
+
+    def _set_status(self, ticket, state, **fields):
+        status = self._tickets.setdefault(ticket, {})
+        status.update(fields, state=state, updated=datetime.now())
+        while len(self._tickets) > self.MAX_TICKETS:
+            _, dropped = self._tickets.popitem(last=False)
+            _remove_file(dropped["path"])
+
+    def _chunks(self, ticket, df, positions, columns):
+        shown = df[columns]
+        for start in range(0, len(positions), self.chunk_rows):
+            chunk = shown.take(positions[start:start + self.chunk_rows])
+            yield chunk
+            with self._lock:
+                self._set_status(ticket, "exporting", rows=start + len(chunk))
+
+    def _export(self, ticket, df, positions, columns, fmt):
+        path = self.status(ticket)["path"]
+        with self._lock:
+            self._set_status(ticket, "exporting")
+        try:
+            with perf.job("export", format=fmt, rows=len(positions)), perf.stage("export:write"):
+                export_formats[fmt][2](self._chunks(ticket, df, positions, columns), path)
+        except Exception as e:
+            _remove_file(path)
+            with self._lock:
+                self._set_status(ticket, "failed", error=str(e))
+            return
+
+        with self._lock:
+            self._set_status(ticket, "ready")
+
+    def _remove_expired(self):
+        cutoff = datetime.now() - timedelta(seconds=self.keep)
+        with self._lock:
+            for ticket, status in list(self._tickets.items()):
+                if status["state"] in ("ready", "failed") and status["updated"] < cutoff:
+                    del self._tickets[ticket]
+                    _remove_file(status["path"])
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+export_jobs = ExportJobs()
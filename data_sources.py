@@ -0,0 +1,407 @@
+import csv
+import hashlib
+import os
+import threading
+import uuid
+from datetime import datetime
+from itertools import chain
+from urllib.parse import quote
+
+import gspread
+import numpy as np
+import pandas as pd
+from gspread.utils import a1_to_rowcol, absolute_range_name, fill_gaps, rowcol_to_a1
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # ParquetSource is unavailable without pyarrow
+    pq = None
+
+try:
+    from python_calamine import CalamineWorkbook
+except ImportError:  # ExcelSource falls back to openpyxl's streaming reader
+    CalamineWorkbook = None
+
+# --------------------------------------------------------------------------------------------------------
+# Data sources for csm_data.py
+#
+# A data source reads worksheets by name and gives access to the "Clear" sheets saves are written to.
+# Every source returns the same raw shape (a header row followed by data rows, as text, or for columnar
+# sources a frame with the header as columns), so sheet_mapping, testimonial_columns and the clear sheet
+# mapping work unchanged whichever one is configured.
+#
+# Reads take an optional column list per sheet; sources return only the header columns named in it (in
+# sheet order) and skip fetching or converting the rest as far as their format allows.
+# --------------------------------------------------------------------------------------------------------
+
+
+def cell_text(value):
+    """How a value is written to (or read as from) a sheet: blanks for missing values, ISO format for dates."""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return ""
+    if isinstance(value, datetime) and value.time() == datetime.min.time():
+        value = value.date()
+    if isinstance(value, (float, np.floating)) and float(value).is_integer():
+        value = int(value)  # ageing columns are float32 after load; write "12", not "12.0"
+    return str(value)
+
+
+def fingerprint(data):
+    """A content hash of raw worksheet values (text rows or a frame), to tell whether a sheet changed."""
+    digest = hashlib.blake2b(digest_size=16)
+    if isinstance(data, pd.DataFrame):
+        digest.update("\x1f".join(map(str, data.columns)).encode())
+        digest.update(pd.util.hash_pandas_object(data, index=False).to_numpy().tobytes())
+    else:
+        for row in data:
+            digest.update("\x1f".join(row).encode())
+            digest.update(b"\x1e")
+    return digest.hexdigest()
+
+
+class DataSource:
+    """Where worksheets are read from and where the "Clear" sheets live."""
+
+    def read_sheet(self, sheet_name, columns=None):
+        """Raw values of one worksheet, limited to ``columns`` when given. Raises if it cannot be read."""
+        raise NotImplementedError
+
+    def read_many(self, sheet_names, columns=None):
+        """``{sheet_name: raw values}`` for the requested worksheets; ``columns`` maps sheet names to the
+        columns to read (missing or None: all of them).
+
+        Sheets that cannot be read are left out (or the whole call raises); callers retry those one by one
+        with ``read_sheet``.
+        """
+        columns = columns or {}
+        return {sheet_name: self.read_sheet(sheet_name, columns.get(sheet_name)) for sheet_name in sheet_names}
+
+    def clear_sheet(self, sheet_name, rows, cols):
+        """A worksheet-like handle on a Clear sheet, created with ``rows`` x ``cols`` cells if missing."""
+        raise NotImplementedError
+
+
+def column_positions(header, columns):
+    """Positions of the header cells named in ``columns`` (None for no projection: every position)."""
+    if columns is None:
+        return list(range(len(header)))
+    wanted = set(columns)
+    return [i for i, name in enumerate(header) if str(name).strip() in wanted]
+
+
+
+# -----------------------------------------------------------------------------------------------------------------
+# --- Google Sheets ---
+# -----------------------------------------------------------------------------------------------------------------
+
+class GoogleSheetsSource(DataSource):
+    """The live spreadsheet, read with values requests through the shared SheetsClient."""
+
+    def __init__(self, client):
+        self.client = client
+        self._headers = {}  # sheet name -> header row, to turn column names into A1 column ranges
+
+    def read_sheet(self, sheet_name, columns=None):
+        if columns is None:
+            response = self.client.spreadsheet.values_get(absolute_range_name(sheet_name))
+            values = response.get("values")
+            return fill_gaps(values) if values else []
+
+        values = self.read_many([sheet_name], {sheet_name: columns})
+        if sheet_name not in values:
+            # The header changed since it was cached; read_many has stored the new one, so this re-plans
+            values = self.read_many([sheet_name], {sheet_name: columns})
+        return values[sheet_name]
+
+    def read_many(self, sheet_names, columns=None):
+        """One batched values request for every sheet; one bad tab name fails the whole call.
+
+        Projected sheets are fetched as whole-column ranges (``'Sheet'!C:E``) worked out from their cached
+        header row; the header is fetched first, in one batched request, for sheets not seen before.
+        The header row itself is fetched again alongside the ranges, so a sheet whose wanted columns have
+        moved, appeared or disappeared is left out (with its new header cached) for the caller to retry.
+        """
+        columns = columns or {}
+        unknown = [name for name in sheet_names if columns.get(name) is not None and name not in self._headers]
+        if unknown:
+            response = self.client.spreadsheet.values_batch_get([absolute_range_name(name, "1:1") for name in unknown])
+            for name, vr in zip(unknown, response.get("valueRanges", [])):
+                self._headers[name] = (vr.get("values") or [[]])[0]
+
+        plan = {}  # sheet name -> (planned column positions, [(first, last) column positions]) or (None, None)
+        ranges = []
+        for name in sheet_names:
+            header = self._headers.get(name) if columns.get(name) is not None else None
+            positions = column_positions(header, columns[name]) if header else []
+            if not positions:
+                plan[name] = (None, None)
+                ranges.append(absolute_range_name(name))
+                continue
+            runs = _column_runs(positions)
+            plan[name] = (positions, runs)
+            ranges.append(absolute_range_name(name, "1:1"))
+            ranges += [absolute_range_name(name, f"{_column_letter(first)}:{_column_letter(last)}")
+                       for first, last in runs]
+
+        response = self.client.spreadsheet.values_batch_get(ranges)
+        value_ranges = iter(response.get("valueRanges", []))
+
+        values = {}
+        for name in sheet_names:
+            positions, runs = plan[name]
+            if runs is None:
+                vr = next(value_ranges, {})
+                # The batch endpoint trims trailing empty cells; pad rows like get_all_values() does
+                values[name] = fill_gaps(vr["values"]) if vr.get("values") else []
+                continue
+            header = (next(value_ranges, {}).get("values") or [[]])[0]
+            rows = _join_runs([next(value_ranges, {}).get("values") or [] for _ in runs],
+                              [last - first + 1 for first, last in runs])
+            if header != self._headers.get(name):
+                self._headers[name] = header
+                if column_positions(header, columns[name]) != positions:
+                    continue
+            values[name] = rows
+        return values
+
+    def clear_sheet(self, sheet_name, rows, cols):
+        """Access or Create the Target Sheet"""
+        try:
+            return self.client.spreadsheet.worksheet(sheet_name)
+        except gspread.exceptions.WorksheetNotFound:
+            return self.client.spreadsheet.add_worksheet(title=sheet_name, rows=str(rows), cols=str(cols))
+
+
+
+# -----------------------------------------------------------------------------------------------------------------
+# --- Local Excel Workbook ---
+# -----------------------------------------------------------------------------------------------------------------
+
+def _column_runs(positions):
+    """Sorted column positions grouped into contiguous (first, last) runs, one A1 range each."""
+    runs = []
+    for pos in positions:
+        if runs and pos == runs[-1][1] + 1:
+            runs[-1] = (runs[-1][0], pos)
+        else:
+            runs.append((pos, pos))
+    return runs
+
+
+def _column_letter(pos):
+    return rowcol_to_a1(1, pos + 1).rstrip("0123456789")
+
+
+def _join_runs(blocks, widths):
+    """Side-by-side rows from several column ranges, each padded to its width and to the longest range."""
+    height = max((len(block) for block in blocks), default=0)
+    rows = [[] for _ in range(height)]
+    for block, width in zip(blocks, widths):
+        for i in range(height):
+            row = block[i] if i < len(block) else []
+            rows[i] += row[:width] + [""] * (width - len(row))
+    return rows
+
+
+
+class ExcelSource(DataSource):
+    """A local .xlsx workbook with one worksheet per sheet name, e.g. an export of the live spreadsheet.
+
+    Only the requested worksheets are read, cell values only, without loading styles or the rest of the
+    workbook: with python-calamine when it is installed (much faster), otherwise with openpyxl in
+    read-only streaming mode. Clear sheets are written as CSV files in ``clear_dir``.
+    """
+
+    def __init__(self, path, clear_dir=None):
+        self.path = path
+        self.clear_dir = clear_dir or os.path.join(os.path.dirname(os.path.abspath(path)), "Clear")
+
+    def read_sheet(self, sheet_name, columns=None):
+        values = self.read_many([sheet_name], {sheet_name: columns})
+        if sheet_name not in values:
+            raise KeyError(f"Worksheet '{sheet_name}' not found in {self.path}")
+        return values[sheet_name]
+
+    def read_many(self, sheet_names, columns=None):
+        columns = columns or {}
+        if CalamineWorkbook is not None:
+            workbook = CalamineWorkbook.from_path(self.path)
+            return {name: _text_rows(workbook.get_sheet_by_name(name).to_python(skip_empty_area=False),
+                                     columns.get(name))
+                    for name in sheet_names if name in workbook.sheet_names}
+
+        import openpyxl
+
+        workbook = openpyxl.load_workbook(self.path, read_only=True, data_only=True, keep_links=False)
+        try:
+            return {name: _text_rows(workbook[name].iter_rows(values_only=True), columns.get(name))
+                    for name in sheet_names if name in workbook.sheetnames}
+        finally:
+            workbook.close()
+
+    def clear_sheet(self, sheet_name, rows, cols):
+        return LocalClearSheet(os.path.join(self.clear_dir, quote(sheet_name, safe=" ") + ".csv"))
+
+
+def _text_rows(rows, columns=None):
+    """Cell values as the text Google Sheets would return, padded to a rectangle.
+
+    With ``columns``, only the cells under those header names are converted.
+    """
+    rows = iter(rows)
+    header = next(rows, None)
+    if header is None:
+        return []
+    if columns is None:
+        return fill_gaps([[cell_text(value) for value in row] for row in chain([header], rows)])
+
+    positions = column_positions(header, columns)
+    return [[cell_text(row[i]) if i < len(row) else "" for i in positions] for row in chain([header], rows)]
+
+
+
+# -----------------------------------------------------------------------------------------------------------------
+# --- Parquet Files ---
+# -----------------------------------------------------------------------------------------------------------------
+
+class ParquetSource(DataSource):
+    """One Parquet file per worksheet (``<directory>/<sheet name>.parquet``), read column-wise.
+
+    Returns frames rather than text rows, so typed columns are kept as they are. Clear sheets are written
+    as CSV files in ``<directory>/Clear``.
+    """
+
+    def __init__(self, directory):
+        if pq is None:
+            raise ImportError("ParquetSource needs pyarrow")
+        self.directory = directory
+
+    def _path(self, sheet_name):
+        return os.path.join(self.directory, quote(sheet_name, safe=" ") + ".parquet")
+
+    def read_sheet(self, sheet_name, columns=None):
+        path = self._path(sheet_name)
+        if columns is not None:
+            names = pq.read_schema(path).names
+            columns = [names[i] for i in column_positions(names, columns)]
+        return pq.read_table(path, columns=columns).to_pandas()
+
+    def read_many(self, sheet_names, columns=None):
+        columns = columns or {}
+        return {name: self.read_sheet(name, columns.get(name))
+                for name in sheet_names if os.path.exists(self._path(name))}
+
+    def clear_sheet(self, sheet_name, rows, cols):
+        return LocalClearSheet(os.path.join(self.directory, "Clear", quote(sheet_name, safe=" ") + ".csv"))
+
+
+
+# -----------------------------------------------------------------------------------------------------------------
+# --- In-Memory Worksheets ---
+# -----------------------------------------------------------------------------------------------------------------
+
+class MemorySource(DataSource):
+    """Worksheets held in memory: an offline stand-in for the spreadsheet, for demos and checks.
+
+    ``sheets`` maps sheet names to rows (header first). ``reads`` counts worksheet reads, and
+    ``set_values`` replaces a sheet's content the way an edit in the spreadsheet would.
+    """
+
+    def __init__(self, sheets=None):
+        self.worksheets = {name: MemoryWorksheet(name, rows) for name, rows in (sheets or {}).items()}
+        self.reads = 0
+
+    def set_values(self, sheet_name, rows):
+        self.worksheets[sheet_name] = MemoryWorksheet(sheet_name, rows)
+
+    def read_sheet(self, sheet_name, columns=None):
+        if sheet_name not in self.worksheets:
+            raise KeyError(f"Worksheet '{sheet_name}' not found")
+        self.reads += 1
+        return _text_rows(self.worksheets[sheet_name].get_all_values(), columns)
+
+    def read_many(self, sheet_names, columns=None):
+        columns = columns or {}
+        return {name: self.read_sheet(name, columns.get(name)) for name in sheet_names if name in self.worksheets}
+
+    def clear_sheet(self, sheet_name, rows, cols):
+        return self.worksheets.setdefault(sheet_name, MemoryWorksheet(sheet_name))
+
+
+class MemoryWorksheet:
+    """A grid of text values with the subset of the gspread Worksheet API that saving uses."""
+
+    def __init__(self, title, values=None):
+        self.title = title
+        self._values = [list(row) for row in values or []]
+        self._lock = threading.Lock()
+
+    def _read(self):
+        return [list(row) for row in self._values]
+
+    def _write(self, values):
+        self._values = values
+
+    def get_all_values(self):
+        values = self._read()
+        return fill_gaps(values) if values else []
+
+    @property
+    def col_count(self):
+        return max((len(row) for row in self._read()), default=0) or 26
+
+    def add_cols(self, cols):
+        pass  # rows grow as needed
+
+    def update(self, values, range_name=None, **kwargs):
+        with self._lock:
+            self._write([list(row) for row in values])
+
+    def batch_update(self, data, **kwargs):
+        with self._lock:
+            values = self._read()
+            for item in data:
+                row, col = a1_to_rowcol(item["range"].split("!")[-1])
+                for i, new_row in enumerate(item["values"]):
+                    while len(values) < row + i:
+                        values.append([])
+                    target = values[row + i - 1]
+                    for j, value in enumerate(new_row):
+                        target.extend([""] * (col + j - len(target)))
+                        target[col + j - 1] = value
+            self._write(values)
+
+    def append_rows(self, rows, **kwargs):
+        with self._lock:
+            self._write(self._read() + [list(row) for row in rows])
+
+
+
+# -----------------------------------------------------------------------------------------------------------------
+# --- Local Clear Sheets ---
+# -----------------------------------------------------------------------------------------------------------------
+
+class LocalClearSheet(MemoryWorksheet):
+    """A Clear sheet kept as a CSV file."""
+
+    _locks = {}
+    _locks_guard = threading.Lock()
+
+    def __init__(self, path):
+        super().__init__(os.path.splitext(os.path.basename(path))[0])
+        self.path = path
+        with self._locks_guard:
+            self._lock = self._locks.setdefault(path, threading.Lock())
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, newline="", encoding="utf-8") as f:
+            return list(csv.reader(f))
+
+    def _write(self, values):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+            csv.writer(f).writerows(values)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,132 @@
+"""Headless "daily action" digests: every CSM's rows from every tab, sorted and highlighted like the app.
+
+Each sheet is loaded once (through csm_data, so the cache, snapshots and configured data source apply),
+split by "CSM Updated" with the same partition index the app filters with, and each CSM's digest is
+rendered as an Excel workbook (one sheet per tab) or an HTML page, in parallel across a process pool:
+
+    python digest.py                                # Excel digests for every CSM in ./digests
+    python digest.py --format html --workers 8 --out "G:\\Shared drives\\digests"
+    python digest.py --csm a123 b456                # only these CSMs
+
+Schedule it (cron / Task Scheduler) ahead of the shift so digests are ready before anyone logs in.
+"""
+
+import argparse
+import html
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import csm_data
+from csm_data import display_columns, get_partition_index, highlight_frame, normalize_logic_id, sheet_mapping, sorted_positions
+
+DIGEST_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "digests")
+
+# Column the digests are split by
+digest_column = "CSM Updated"
+
+
+
+def load_tabs():
+    """Every tab's frame, fetched in one batch; tabs that could not be loaded are left out."""
+    frames = csm_data.load_sheets(list(sheet_mapping.values()))
+    return {tab: frames[sheet_name] for tab, sheet_name in sheet_mapping.items() if not frames[sheet_name].empty}
+
+
+def partition_by_csm(tabs, only=None):
+    """``{csm: {tab: rows}}`` with each CSM's rows of every tab, sorted by the tab's ageing column.
+
+    ``only`` limits the result to those (normalized) CSM IDs.
+    """
+    digests = {}
+    for tab, df in tabs.items():
+        if digest_column not in df.columns:
+            continue
+        shown = df[display_columns(tab, df)]
+        for csm, positions in get_partition_index(tab, df, digest_column).items():
+            if not csm or (only is not None and csm not in only):
+                continue
+            digests.setdefault(csm, {})[tab] = shown.take(sorted_positions(tab, df, positions))
+    return digests
+
+
+def _styled(tab, rows):
+    return rows.style.apply(highlight_frame, axis=None, tab=tab)
+
+
+def render_excel(tabs, path):
+    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+        for tab, rows in tabs.items():
+            _styled(tab, rows).to_excel(writer, sheet_name=tab[:31], index=False)
+
+
+def render_html(csm, tabs, path):
+    sections = []
+    for tab, rows in tabs.items():
+        table = (_styled(tab, rows)
+                 .format({"Clearance Date": lambda d: "" if pd.isna(d) else f"{d:%Y-%m-%d}"}, na_rep="")
+                 .hide(axis="index")
+                 .to_html())
+        sections.append(f"<h2>{html.escape(tab)} ({len(rows)})</h2>\n{table}")
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"<!DOCTYPE html>\n<html><head><meta charset='utf-8'><title>Daily Action - {html.escape(csm)}</title>"
+                "<style>body{font-family:sans-serif} table{border-collapse:collapse} "
+                "td,th{border:1px solid #ccc;padding:2px 6px;font-size:13px}</style></head>\n"
+                f"<body><h1>📌 Daily Action - {html.escape(csm)}</h1>\n" + "\n".join(sections) + "\n</body></html>")
+
+
+def render_digest(task):
+    """Writes one CSM's digest; runs in a worker process. Returns ``(csm, path, rows)``."""
+    csm, tabs, fmt, out_dir = task
+    path = os.path.join(out_dir, f"{_file_name(csm)}.{'xlsx' if fmt == 'excel' else 'html'}")
+    if fmt == "excel":
+        render_excel(tabs, path)
+    else:
+        render_html(csm, tabs, path)
+    return csm, path, sum(len(rows) for rows in tabs.values())
+
+
+def _file_name(csm):
+    return re.sub(r"[^\w.-]+", "_", csm) or "_"
+
+
+def build_digests(fmt="excel", out_dir=DIGEST_DIR, workers=None, only=None):
+    """Renders every CSM's digest into ``out_dir``; returns ``[(csm, path, rows)]``."""
+    os.makedirs(out_dir, exist_ok=True)
+    with csm_data.perf.job("digest", format=fmt):
+        with csm_data.perf.stage("load"):
+            tabs = load_tabs()
+        with csm_data.perf.stage("partition"):
+            digests = partition_by_csm(tabs, only)
+
+        tasks = [(csm, csm_tabs, fmt, out_dir) for csm, csm_tabs in sorted(digests.items())]
+        with csm_data.perf.stage("render"):
+            if workers == 1:
+                return [render_digest(task) for task in tasks]
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                return list(pool.map(render_digest, tasks, chunksize=max(1, len(tasks) // (4 * (workers or os.cpu_count() or 1)))))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--format", choices=["excel", "html"], default="excel")
+    parser.add_argument("--out", default=DIGEST_DIR, help="directory the digests are written to")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument("--csm", nargs="+", help="only these CSM IDs")
+    args = parser.parse_args(argv)
+    csm_data.run_headless()
+
+    started = time.perf_counter()
+    only = {normalize_logic_id(csm) for csm in args.csm} if args.csm else None
+    written = build_digests(args.format, args.out, args.workers, only)
+    print(f"{len(written)} digest(s), {sum(rows for _, _, rows in written)} rows, written to {args.out} "
+          f"in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
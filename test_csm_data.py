@@ -0,0 +1,104 @@
+"""Checks of the data layer against an in-memory spreadsheet (MemorySource); run with ``python -m pytest``."""
+
+import os
+
+os.environ.setdefault("CSM_PERF_LOG", "off")
+os.environ.setdefault("CSM_PREWARM", "off")
+os.environ.setdefault("CSM_DATA_SOURCE", "memory")
+
+import pandas as pd
+import pytest
+
+import csm_data
+from data_sources import MemorySource
+
+TAB = "Open - Complaint - SR"
+SHEET = csm_data.sheet_mapping[TAB]
+
+
+def sheet_rows(ids, remarks=None):
+    """The complaint sheet as a header and one row per id."""
+    header = ["Date", "Month", "Zone", "Id", "Nation", "CSM Updated", "All India"] + csm_data.editable_columns
+    rows = []
+    for i, row_id in enumerate(ids):
+        row = {col: "" for col in header}
+        row.update({"Id": row_id, "CSM Updated": "a123", "Remarks": (remarks or {}).get(i, f"remark {i}")})
+        rows.append([row[col] for col in header])
+    return [header] + rows
+
+
+@pytest.fixture
+def source(monkeypatch):
+    source = MemorySource({SHEET: sheet_rows(["T1", "T2", "T3"])})
+    monkeypatch.setattr(csm_data, "data_source", source)
+    monkeypatch.setattr(csm_data, "sheet_cache", csm_data.SheetCache(ttl=csm_data.sheet_ttl))
+    monkeypatch.setattr(csm_data, "_parsed", {})
+    return source
+
+
+def edit(df, label, **cells):
+    edited = df.copy()
+    for col, value in cells.items():
+        edited.at[label, col] = value
+    return edited
+
+
+def test_unchanged_reload_keeps_frame_and_indexes(source):
+    df = csm_data.load_data(SHEET)
+    index = csm_data.get_partition_index(TAB, df, "CSM Updated")
+
+    csm_data.sheet_cache.invalidate(SHEET)
+    assert csm_data.load_data(SHEET) is df
+    assert csm_data.get_partition_index(TAB, df, "CSM Updated") is index
+    assert source.reads == 2
+
+    source.set_values(SHEET, sheet_rows(["T1", "T2", "T3"], remarks={1: "changed"}))
+    csm_data.sheet_cache.invalidate(SHEET)
+    reloaded = csm_data.load_data(SHEET)
+    assert reloaded is not df
+    assert reloaded["Remarks"].tolist() == ["remark 0", "changed", "remark 2"]
+
+
+def test_save_to_empty_clear_sheet_writes_header(source):
+    df = csm_data.load_data(SHEET)
+    columns = csm_data.display_columns(TAB, df)
+    pending = csm_data.prepare_save(edit(df[columns], 1, Remarks="checked"), TAB, original=df)
+
+    assert csm_data.write_save(pending) > 0
+    values = source.worksheets[csm_data.clear_sheet_for(TAB)].get_all_values()
+    header = values[0]
+    assert header == pending.columns
+    assert [(row[0], row[header.index("Remarks")]) for row in values[1:]] == [("T2", "checked")]
+
+
+def test_save_writes_only_changed_cells(source):
+    df = csm_data.load_data(SHEET)
+    columns = csm_data.display_columns(TAB, df)
+    csm_data.write_save(csm_data.prepare_save(edit(df[columns], 1, Remarks="first"), TAB, original=df))
+
+    pending = csm_data.prepare_save(edit(df[columns], 1, Remarks="second", **{"Support Required": "yes"}),
+                                    TAB, original=df)
+    assert pending.changes == {"T2": {"Remarks": "second", "Support Required": "yes"}}
+    assert csm_data.write_save(pending) == 2
+
+    values = source.worksheets[csm_data.clear_sheet_for(TAB)].get_all_values()
+    header = values[0]
+    assert len(values) == 2
+    assert values[1][header.index("Remarks")] == "second"
+    assert values[1][header.index("Support Required")] == "yes"
+
+
+def test_edits_to_rows_sharing_a_key_stay_apart():
+    df = pd.DataFrame({"Id": ["T1", "T1", "", ""], "Remarks": ["a", "b", "c", "d"]})
+    ids = csm_data.row_ids(df, "Id")
+    assert ids.is_unique
+
+    edits = csm_data.collect_edits(df, edit(df, 0, Remarks="x"), ids, {}, columns=["Remarks"])
+    shown = csm_data.apply_edits(df, edits, ids)
+    edits = csm_data.collect_edits(df, edit(shown, 2, Remarks="y"), ids, edits, columns=["Remarks"], shown=shown)
+    assert edits == {ids[0]: {"Remarks": "x"}, ids[2]: {"Remarks": "y"}}
+    assert csm_data.apply_edits(df, edits, ids)["Remarks"].tolist() == ["x", "b", "y", "d"]
+
+    # Duplicate keys cannot locate a row in the Clear sheet, so the sheet is saved whole
+    assert csm_data.row_key_column(df) is None
+    assert csm_data.row_key_column(df.assign(Id=["T1", "T2", "", ""])) == "Id"